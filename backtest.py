@@ -0,0 +1,273 @@
+"""
+    backtest price oracles against stored statistic history
+
+    the 48hours statistic only covers 2 days, so record it every now and then
+    (`python backtest.py record`), every record is merged into one history file per item.
+    then replay it (`python backtest.py run`): at each past basis time every candidate oracle
+    gives a price using only the data before that time, and it is scored against what
+    actually got traded in the following {horizon} hours:
+        - error: mean |oracle - realized| / realized, realized = volume weighted mean of the medians
+        - bias: mean (oracle - realized) / realized, positive means the oracle is too greedy
+        - fill: how often a sell order at the oracle price would have been filled,
+                i.e. some deal's max price in the horizon reached it
+        - coverage: how often the oracle gives a price at all
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import argparse
+import datetime
+import json
+import math
+import os
+
+import numpy as np
+from tabulate import tabulate
+
+import oracle
+
+def get_history_path(history_dir: str, url_name: str):
+    return os.path.join(history_dir, f'{url_name}.json')
+
+def merge_statistic_json(old: dict, new: dict) -> dict:
+    """
+        merge 2 raw statistic payloads (the json warframe market gives, not Statistic),
+        timeslots are deduped by (datetime, mod_rank, subtype) and the newer one wins
+    """
+    merged = {}
+    for stat_type in new:
+        merged[stat_type] = {}
+        for timeframe_type in new[stat_type]:
+            slots = {
+                (stat['datetime'], stat.get('mod_rank', 0), stat.get('subtype')): stat
+                for stat in old.get(stat_type, {}).get(timeframe_type, []) + new[stat_type][timeframe_type]
+            }
+            merged[stat_type][timeframe_type] = sorted(slots.values(), key=lambda stat: stat['datetime'])
+    return merged
+
+def record_statistic_history(market_items: list, history_dir: str):
+    """
+        fetch the statistic of every item and merge it into the history files
+    """
+    from joblib import Parallel, delayed
+    from tqdm import tqdm
+    import util
+
+    os.makedirs(history_dir, exist_ok=True)
+
+    def task(item):
+        path = get_history_path(history_dir, item.url_name)
+        new = item._get_statistic_json(priority='background', job='backtest record')
+        old = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                old = json.load(f)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(merge_statistic_json(old, new), f)
+        os.replace(path + '.tmp', path)
+
+    with util.tqdm_joblib(tqdm(range(len(market_items)), 'Recording items...')) as tqdm_progress:
+        Parallel(n_jobs=5, require='sharedmem')(delayed(task)(item) for item in market_items)
+
+def load_statistic_history(history_dir: str, url_name: str):
+    from warframe_market import Statistic
+    with open(get_history_path(history_dir, url_name)) as f:
+        return Statistic(json.load(f))
+
+"""
+    Replaying
+"""
+
+@dataclass
+class BacktestScore:
+    """
+        sums, so scores from different items / processes can just be added together
+    """
+    n: int = 0              # basis times where there are deals to compare to
+    n_priced: int = 0       # ... and the oracle gives a price
+    abs_error: float = 0
+    error: float = 0
+    fill: float = 0
+
+    def __add__(self, other: 'BacktestScore'):
+        return BacktestScore(
+            self.n + other.n, self.n_priced + other.n_priced,
+            self.abs_error + other.abs_error, self.error + other.error, self.fill + other.fill
+        )
+
+    def summary(self):
+        "(error, bias, fill, coverage)"
+        if self.n_priced == 0:
+            return (float('nan'),) * 3 + (0,)
+        return (self.abs_error / self.n_priced, self.error / self.n_priced,
+                self.fill / self.n_priced, self.n_priced / self.n)
+
+def build_replay(statistic, basis_times: list[datetime.datetime], timeframe: str = '48hours',
+                 mod_rank_range: list | range = [0]):
+    """
+        one row per basis time, every row has every timeslot of the statistic,
+        so the oracles see the same item once per basis time.
+
+        return (StatMatrix, max_price of every slot)
+    """
+    slots = [
+        stat for stat in statistic.statistics['statistics_closed'][timeframe]
+        if stat['mod_rank'] in mod_rank_range
+    ]
+    slot_time = np.array([stat['datetime'].timestamp() for stat in slots])
+    basis = np.array([t.timestamp() for t in basis_times])
+    age = (basis[:, None] - slot_time[None, :]) / 3600
+
+    def tile(key):
+        return np.broadcast_to(np.array([stat[key] for stat in slots], dtype=float), age.shape)
+
+    stats = oracle.StatMatrix(tile('median'), tile('volume'), age, age >= 0)
+    return stats, tile('max_price')
+
+def get_basis_times(statistic, lookback: float, horizon: float, step: float = 1,
+                    timeframe: str = '48hours'):
+    """
+        every {step} hours, starting after the first {lookback} hours of history
+        and ending {horizon} hours before the history ends
+    """
+    times = [stat['datetime'] for stat in statistic.statistics['statistics_closed'][timeframe]]
+    if not times:
+        return []
+    cur, end = min(times) + datetime.timedelta(hours=lookback), max(times) - datetime.timedelta(hours=horizon)
+    basis_times = []
+    while cur <= end:
+        basis_times.append(cur)
+        cur += datetime.timedelta(hours=step)
+    return basis_times
+
+def score_oracles(stats: oracle.StatMatrix, max_price: np.ndarray,
+                  strategies: list[oracle.OracleStrategy], horizon: float) -> dict[str, BacktestScore]:
+    """
+        score every strategy on every row of the replay
+    """
+    future = (stats.age < 0) & (stats.age >= -horizon) & (stats.volume > 0)
+    future_volume = np.where(future, stats.volume, 0).sum(axis=1)
+    realized = np.divide((stats.median * stats.volume * future).sum(axis=1), future_volume,
+                         out=np.zeros(stats.n_items), where=future_volume > 0)
+    future_max = np.where(future, max_price, -np.inf).max(axis=1)
+    has_future = realized > 0
+
+    # there is no order history, every order book is empty
+    empty_orders = np.full((stats.n_items, 1), np.nan)
+    market = oracle.MarketMatrix(stats, oracle.OrderMatrix(empty_orders, empty_orders))
+
+    scores = {}
+    for strategy in strategies:
+        price = strategy.evaluate(market)
+        priced = has_future & (price > 0)
+        relative = (price[priced] - realized[priced]) / realized[priced]
+        scores[strategy.name] = BacktestScore(
+            int(has_future.sum()), int(priced.sum()),
+            float(np.abs(relative).sum()), float(relative.sum()),
+            float((future_max[priced] >= price[priced]).sum())
+        )
+    return scores
+
+def _backtest_items(task: tuple) -> dict[str, dict[str, BacktestScore]]:
+    """
+        process pool worker, does a chunk of items.
+        only paths and strategies are sent over, the history is loaded inside the worker
+    """
+    history_dir, url_names, strategies, lookback, horizon, step = task
+    result = {}
+    for url_name in url_names:
+        statistic = load_statistic_history(history_dir, url_name)
+        basis_times = get_basis_times(statistic, lookback, horizon, step)
+        if not basis_times:
+            continue
+        stats, max_price = build_replay(statistic, basis_times)
+        result[url_name] = score_oracles(stats, max_price, strategies, horizon)
+    return result
+
+def run_backtest(history_dir: str, strategies: list[oracle.OracleStrategy] | None = None,
+                 url_names: list[str] | None = None, lookback: float = 48, horizon: float = 24,
+                 step: float = 1, max_workers: int | None = None,
+                 chunk_size: int = 32) -> dict[str, dict[str, BacktestScore]]:
+    """
+        strategies: None for every registered oracle. there is no order history, so ones that
+                    need orders see an empty order book (i.e. lower coverage if they rely on it)
+        url_names: None for every item in history_dir
+
+        return {url_name -> {strategy name -> BacktestScore}}
+    """
+    if strategies is None:
+        strategies = list(oracle.oracle_registry.values())
+    if url_names is None:
+        url_names = sorted(name[:-len('.json')] for name in os.listdir(history_dir) if name.endswith('.json'))
+
+    tasks = [
+        (history_dir, url_names[i:i+chunk_size], strategies, lookback, horizon, step)
+        for i in range(0, len(url_names), chunk_size)
+    ]
+    result = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_result in executor.map(_backtest_items, tasks):
+            result.update(chunk_result)
+    return result
+
+def summarize_backtest(result: dict[str, dict[str, BacktestScore]],
+                       item_categories: dict[str, str]) -> dict[str, dict[str, BacktestScore]]:
+    """
+        item_categories: url_name -> category
+        return {category (and 'all') -> {strategy name -> BacktestScore}}
+    """
+    summary = {}
+    for url_name, scores in result.items():
+        for category in ['all', item_categories.get(url_name, 'default')]:
+            for name, score in scores.items():
+                summary.setdefault(category, {})
+                summary[category][name] = summary[category].get(name, BacktestScore()) + score
+    return summary
+
+def ratio_grid(func=oracle.top_ratio_mean, hours: float = 48,
+               ratios: list[float] = [0.1, 0.2, 0.3, 0.5, 0.7, 1]) -> list[oracle.OracleStrategy]:
+    """
+        candidate strategies for tuning the ratio, e.g. the 0.3 in top_ratio_mean
+    """
+    return [
+        oracle.OracleStrategy(f'{func.__name__}({hours}h, {ratio})', func, {'hours': hours, 'ratio': ratio})
+        for ratio in ratios
+    ]
+
+def print_backtest_summary(summary: dict[str, dict[str, BacktestScore]]):
+    "best error first, oracles that priced nothing (error NaN) last"
+    for category, scores in summary.items():
+        print(f'Category: {category}')
+        print(tabulate(
+            [[name, *score.summary(), score.n] for name, score in
+             sorted(scores.items(), key=lambda a: (math.isnan(a[1].summary()[0]), a[1].summary()[0]))],
+            headers=['Oracle', 'Error', 'Bias', 'Fill', 'Coverage', 'N'],
+            tablefmt='rounded_outline', floatfmt='.3f'
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(description='backtest price oracles against stored statistic history')
+    parser.add_argument('command', choices=['record', 'run'])
+    parser.add_argument('--history-dir', default='history')
+    parser.add_argument('--horizon', type=float, default=24, help='hours after basis time to score against')
+    parser.add_argument('--step', type=float, default=1, help='hours between basis times')
+    parser.add_argument('--ratio-grid', action='store_true', help='also try different ratios for top_ratio_mean')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    import warframe_market as wfm
+    market_items = wfm.get_market_item_list()
+
+    if args.command == 'record':
+        record_statistic_history(market_items, args.history_dir)
+        return
+
+    strategies = list(oracle.oracle_registry.values())
+    if args.ratio_grid:
+        strategies += ratio_grid()
+    result = run_backtest(args.history_dir, strategies, horizon=args.horizon,
+                          step=args.step, max_workers=args.workers)
+    item_categories = {item.url_name: oracle.get_item_category(item.item_name) for item in market_items}
+    print_backtest_summary(summarize_backtest(result, item_categories))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+    import time budget, startup is most of the run time for the short cron jobs
+
+    every module below is imported in a fresh interpreter with `python -X importtime`, and it must
+        - take less than its budget (ms, cumulative, best of a few runs)
+        - not pull in the heavy modules it doesn't need at import time
+
+    ```
+    python check_import_time.py        # exits with 1 if anything is over budget
+    ```
+"""
+import subprocess
+import sys
+
+HEAVY = ['requests', 'joblib', 'tqdm', 'tabulate', 'prompt_toolkit', 'numpy']
+
+# module -> (budget in ms, heavy modules it may import)
+BUDGETS = {
+    'warframe_market': (40, []),
+    'util': (10, []),
+    'fetch': (60, []),
+    'oracle': (250, ['numpy']),
+    'prefetch': (400, ['prompt_toolkit']),
+    'interactive': (400, ['prompt_toolkit']),
+}
+
+def measure(module: str, runs: int = 3) -> tuple[float, set[str]]:
+    """
+        return (best cumulative import time in ms, heavy modules imported)
+    """
+    code = f'import sys, {module}; print(" ".join(sorted(sys.modules)))'
+    best, imported = float('inf'), set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.removeprefix('import time:').split('|')
+            if len(parts) == 3 and parts[2].strip() == module:
+                best = min(best, int(parts[1]) / 1000)
+        imported = {name.split('.')[0] for name in result.stdout.split()}
+    return best, imported & set(HEAVY)
+
+def main():
+    failed = False
+    for module, (budget, allowed) in BUDGETS.items():
+        ms, heavy = measure(module)
+        unexpected = sorted(heavy - set(allowed))
+        ok = ms <= budget and not unexpected
+        failed |= not ok
+        print(f'{"ok  " if ok else "FAIL"} {module:<16} {ms:7.1f} ms (budget {budget} ms)'
+              + (f', imports {", ".join(unexpected)}' if unexpected else ''))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+    end to end check of scan.py against fake_api.py, with several local worker processes
+
+    starts the stand-in API, makes a scan, starts {workers} `scan.py work` processes,
+    kills one of them in the middle of a shard (its lease has to expire and the shard
+    go to someone else), then merges and checks every item made it with the right data.
+    one catalog item is 404 on the API, it has to be left out and reported, not stall the scan.
+
+    ```
+    python check_scan.py        # exits with 1 if anything is wrong
+    ```
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description='check scan.py with local workers and a fake API')
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--shards', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--lease', type=float, default=3)
+    args = parser.parse_args()
+
+    import fake_api
+    missing_index = args.items // 2
+    server, api = fake_api.start(n_items=args.items, latency=0.01, busy=0.02, missing=[missing_index])
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    os.environ['WFM_API_BASE'] = base
+    os.environ['WFM_RATE_LIMIT'] = '200'
+
+    import warframe_market as wfm
+    import scan
+    import snapshot
+    wfm.API_BASE = base
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path, out_dir = os.path.join(tmp, 'scan.db'), os.path.join(tmp, 'scan')
+        scan_id = scan.start_scan(db_path, args.shards)
+        start = time.monotonic()
+
+        workers = [
+            subprocess.Popen(
+                [sys.executable, os.path.join(root, 'scan.py'), 'work', '--db', db_path,
+                 '--out-dir', out_dir, '--lease', str(args.lease)],
+                cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            for _ in range(args.workers)
+        ]
+        # kill one as soon as it holds a shard
+        queue = scan.WorkQueue(db_path)
+        while not any(shard['status'] == 'leased' for shard in queue.get_shards(scan_id)):
+            time.sleep(0.05)
+        workers[0].kill()
+
+        scan.wait_scan(db_path, scan_id, poll=1)
+        merged_path = scan.merge_scan(db_path, scan_id, out_dir)
+        for worker in workers:
+            worker.wait(timeout=60)
+
+        shards = queue.get_shards(scan_id)
+        items = snapshot.load_snapshot(merged_path).get_market_items()
+        errors = []
+        if any(shard['status'] != 'done' for shard in shards):
+            errors.append('some shards are not done')
+        if [item.url_name for item in items] != [item['urlName'] for i, item in enumerate(api.catalog) if i != missing_index]:
+            errors.append('merged items are not the catalog without the missing item, in order')
+        if sum((json.loads(shard['missing'] or '[]') for shard in shards), []) != [api.catalog[missing_index]['id']]:
+            errors.append('the missing item is not recorded as missing')
+        for item in items:
+            i = int(item.url_name.removeprefix('fake_item_'))
+            medians = [stat['median'] for stat in item.statistic.statistics['statistics_closed']['48hours']]
+            if medians != [fake_api.get_median(i, h) for h in range(48, 0, -1)]:
+                errors.append(f'{item.url_name} has the wrong statistic')
+                break
+            if len(item.orders.orders) != len(fake_api.get_orders(i)):
+                errors.append(f'{item.url_name} has the wrong orders')
+                break
+
+    print(f'{len(items)} items merged from {len(shards)} shards in {time.monotonic() - start:.1f} s, '
+          f'{sum(shard["attempts"] > 1 for shard in shards)} shard(s) taken over after the kill, '
+          f'{api.hits} API hits')
+    for error in errors:
+        print(f'FAIL {error}')
+    sys.exit(1 if errors else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+category_oracle_map = {
+    'default': 'top_ratio_mean',
+    'fresh prime': 'fresh_prime',
+    'equilibrium': 'equilibrium',
+}
+
+# item name (or item name prefix, e.g. the whole prime set) -> category
+# anything not in here is 'default', which is the old top 30% mean. e.g.
+#     'Sevagoth Prime': 'fresh prime',
+#     'Ember Prime': 'equilibrium',
+item_category_map = {
+}
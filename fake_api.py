@@ -0,0 +1,137 @@
+"""
+    stand-in warframe market API, for trying scan.py / server.py / the fetch layer locally
+    without hitting (or waiting for) the real one
+
+    serves the same paths as warframe market with made up but deterministic data:
+        /v2/items, /v1/items/<url_name>/orders, /v1/items/<url_name>/statistics
+    unknown items are 404, and so are the --missing ones (in the catalog, but not fetchable).
+    --latency and --busy make it slow / answer 429 now and then.
+
+    ```
+    python fake_api.py --port 8700 --items 400
+    WFM_API_BASE=http://127.0.0.1:8700 WFM_RATE_LIMIT=200 python scan.py work
+    ```
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+
+def get_catalog(n_items: int, n_sets: int = 0) -> list[dict]:
+    """
+        n_items plain items, then n_sets prime sets of 3 items each ("Fake 0 Prime Set", "Fake 0 Prime Blueprint",
+        "Fake 0 Prime Barrel"), tagged like the real list and without setRoot / setParts
+    """
+    names = [(f'Fake Item {i}', ['fake']) for i in range(n_items)] + [
+        (f'Fake {j} Prime {part}', ['prime', tag])
+        for j in range(n_sets) for part, tag in [('Set', 'set'), ('Blueprint', 'blueprint'), ('Barrel', 'component')]
+    ]
+    return [
+        {'id': f'{i:024x}', 'urlName': name.lower().replace(' ', '_'), 'tags': tags,
+         'i18n': {'en': {'name': name, 'thumb': f'items/{name.lower().replace(" ", "_")}.png'}}}
+        for i, (name, tags) in enumerate(names)
+    ]
+
+def get_median(index: int, hours_ago: int) -> float:
+    "what the statistic of item {index} says for {hours_ago} hours ago"
+    return 10 + index % 50 + hours_ago % 5
+
+def get_statistics(index: int, now: datetime.datetime) -> dict:
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def stat(time: datetime.datetime, median: float):
+        return {'datetime': time.isoformat(), 'volume': 1 + index % 7, 'min_price': median - 2,
+                'max_price': median + 2, 'avg_price': median, 'median': median, 'mod_rank': 0}
+
+    closed = {
+        '48hours': [stat(hour - datetime.timedelta(hours=h), get_median(index, h)) for h in range(48, 0, -1)],
+        '90days': [stat(day - datetime.timedelta(days=d), get_median(index, d)) for d in range(90, 0, -1)],
+    }
+    return {'statistics_closed': closed, 'statistics_opened': {'48hours': [], '90days': []}}
+
+def get_orders(index: int) -> list[dict]:
+    return [
+        {'order_type': order_type, 'visible': True, 'platinum': 10 + index % 50 + k * (1 if order_type == 'sell' else -1),
+         'quantity': 1, 'mod_rank': 0, 'user': {'reputation': k, 'status': ['ingame', 'online', 'offline'][k % 3]}}
+        for order_type in ['sell', 'buy'] for k in range(3)
+    ]
+
+class FakeAPI:
+    def __init__(self, n_items: int = 200, latency: float = 0, busy: float = 0, missing: list[int] = (),
+                 n_sets: int = 0):
+        """
+            latency: seconds every response takes
+            busy: chance of answering 429 instead
+            missing: indices of catalog items whose orders / statistics are 404
+            n_sets: prime sets after the plain items, see get_catalog
+        """
+        self.catalog = get_catalog(n_items, n_sets)
+        self.index = {item['urlName']: i for i, item in enumerate(self.catalog) if i not in missing}
+        self.latency = latency
+        self.busy = busy
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def handle(self, path: str) -> tuple[int, dict]:
+        with self._lock:
+            self.hits += 1
+        time.sleep(self.latency)
+        if random.random() < self.busy:
+            return 429, {'error': 'too many requests'}
+        match path.strip('/').split('/'):
+            case ['v2', 'items']:
+                return 200, {'data': self.catalog}
+            case ['v1', 'items', url_name, 'orders'] if url_name in self.index:
+                return 200, {'payload': {'orders': get_orders(self.index[url_name])}}
+            case ['v1', 'items', url_name, 'statistics'] if url_name in self.index:
+                return 200, {'payload': get_statistics(self.index[url_name], datetime.datetime.now(datetime.timezone.utc))}
+        return 404, {'error': 'not found'}
+
+def make_handler(api: FakeAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            status, body = api.handle(self.path)
+            body = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+def start(port: int = 0, **api_kwargs) -> tuple[ThreadingHTTPServer, FakeAPI]:
+    "serve in a background thread, port 0 picks a free one (see server.server_address)"
+    api = FakeAPI(**api_kwargs)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, api
+
+def main():
+    parser = argparse.ArgumentParser(description='stand-in warframe market API')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0, help='seconds every response takes')
+    parser.add_argument('--busy', type=float, default=0, help='chance of answering 429')
+    parser.add_argument('--missing', type=int, nargs='*', default=[], help='indices of items that are 404')
+    parser.add_argument('--sets', type=int, default=0, help='prime sets (3 items each) after the plain items')
+    args = parser.parse_args()
+
+    server, _ = start(args.port, n_items=args.items, latency=args.latency, busy=args.busy, missing=args.missing,
+                      n_sets=args.sets)
+    print(f'serving on http://127.0.0.1:{server.server_address[1]}')
+    threading.Event().wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+    the fetch layer, everything that hits the API should go through here
+    so there is only one rate limit for the whole process
+
+    every request has a priority class, ['interactive', 'prefetch', 'watch', 'background'].
+    a request of a higher class is always dispatched before any lower one that is still waiting,
+    and some of the workers are kept for 'interactive' only, so a user typing a query
+    doesn't wait behind thousands of queued background fetches.
+    inside a class, requests are round-robin over jobs (e.g. each background job), so
+    one big job doesn't starve the others.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+
+PRIORITIES = ['interactive', 'prefetch', 'watch', 'background']
+
+class FetchError(Exception):
+    "the request got a response that is not 200 and won't be retried (any more)"
+    def __init__(self, response, attempts: int):
+        super().__init__(f'status {response.status_code} after {attempts} attempt(s): {getattr(response, "url", "")}')
+        self.response = response
+        self.status_code = response.status_code
+        self.attempts = attempts
+
+def is_retryable(status_code: int):
+    "too many requests, or the server is having a bad time"
+    return status_code == 429 or status_code >= 500
+
+@dataclass
+class FetchRequest:
+    args: tuple
+    kwargs: dict
+    priority: str
+    job: str
+    future: Future = field(default_factory=Future)
+    queued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+class TokenBucket:
+    """
+        {rate} tokens per second, at most {burst} tokens saved up
+        not thread safe, the scheduler holds its lock when using this
+    """
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def time_until_token(self):
+        self._refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+class FetchScheduler:
+    def __init__(self, rate: float = 3, burst: float = 3, max_workers: int = 5,
+                 reserved_interactive: int = 1, max_attempts: int = 10, get=None):
+        """
+            rate, burst: global rate limit, in requests per second
+            max_workers: max requests in flight
+            reserved_interactive: that many workers can only be used by 'interactive'
+            max_attempts: 429 / 5xx are retried up to that many attempts in total
+            get: function that does the actual request, requests.get if None
+        """
+        if get is None:
+            import requests
+            get = requests.get
+        self._get = get
+        self._bucket = TokenBucket(rate, burst)
+        self._max_workers = max_workers
+        self._max_attempts = max_attempts
+        self._reserved_interactive = reserved_interactive
+
+        self._cond = threading.Condition()
+        self._queues: dict[str, OrderedDict[str, deque[FetchRequest]]] = {p: OrderedDict() for p in PRIORITIES}
+        self._in_flight = 0
+        self._waits = {p: deque(maxlen=1000) for p in PRIORITIES}
+        self._dispatched = {p: 0 for p in PRIORITIES}
+        self._retries = {p: 0 for p in PRIORITIES}
+
+        # daemon threads instead of a ThreadPoolExecutor, so exiting doesn't wait for queued fetches
+        self._work: queue.Queue[FetchRequest] = queue.Queue()
+        for _ in range(max_workers):
+            threading.Thread(target=self._work_loop, daemon=True).start()
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def submit(self, *args, priority: str = 'interactive', job: str = 'default', **kwargs) -> Future:
+        """
+            queue a GET request, the future resolves to the response once it is 200.
+            429 / 5xx are retried, other statuses (e.g. 404) fail right away with FetchError
+            args, kwargs: given to requests.get
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'unknown priority {priority}, should be one of {PRIORITIES}')
+        request = FetchRequest(args, kwargs, priority, job)
+        with self._cond:
+            self._queues[priority].setdefault(job, deque()).append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def request(self, *args, priority: str = 'interactive', job: str = 'default', **kwargs):
+        "blocking version of submit()"
+        return self.submit(*args, priority=priority, job=job, **kwargs).result()
+
+    def _pick_priority(self):
+        """
+            the highest class that has something queued and is allowed a worker
+            must hold self._cond
+        """
+        for priority in PRIORITIES:
+            if not self._queues[priority]:
+                continue
+            limit = self._max_workers if priority == 'interactive' else self._max_workers - self._reserved_interactive
+            if self._in_flight < limit:
+                return priority
+            return None     # don't let a lower class go first just because the higher one is full
+        return None
+
+    def _pop(self, priority: str) -> FetchRequest:
+        "round-robin over jobs, must hold self._cond"
+        jobs = self._queues[priority]
+        job, queue = next(iter(jobs.items()))
+        request = queue.popleft()
+        del jobs[job]
+        if queue:
+            jobs[job] = queue   # to the back
+        return request
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    priority = self._pick_priority()
+                    if priority is None:
+                        self._cond.wait()
+                        continue
+                    # re-check after waiting, something more important may have been queued
+                    wait = self._bucket.time_until_token()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    break
+                self._bucket.take()
+                request = self._pop(priority)
+                self._in_flight += 1
+                self._dispatched[priority] += 1
+                self._waits[priority].append(time.monotonic() - request.queued_at)
+            self._work.put(request)
+
+    def _work_loop(self):
+        while True:
+            self._run(self._work.get())
+
+    def _run(self, request: FetchRequest):
+        requeue = False
+        try:
+            request.attempts += 1
+            r = self._get(*request.args, **request.kwargs)
+            if r.status_code == 200:
+                request.future.set_result(r)
+            elif is_retryable(r.status_code) and request.attempts < self._max_attempts:
+                requeue = True
+            else:
+                request.future.set_exception(FetchError(r, request.attempts))
+        except Exception as e:
+            request.future.set_exception(e)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                if requeue:
+                    # too many requests or so, try again at the front of its own job queue.
+                    # the rate limit is global, so everyone waits a random time (up to 1 sec) for it
+                    self._retries[request.priority] += 1
+                    request.queued_at = time.monotonic()
+                    jobs = self._queues[request.priority]
+                    jobs.setdefault(request.job, deque()).appendleft(request)
+                    jobs.move_to_end(request.job, last=False)
+                    self._bucket.tokens -= random.uniform(0, 1) * self._bucket.rate
+                self._cond.notify_all()
+
+    def get_metrics(self) -> dict[str, dict]:
+        """
+            per priority class:
+                - depth: requests waiting, jobs: jobs waiting
+                - dispatched, retries: counts since start
+                - mean_wait, p95_wait, max_wait: seconds spent in queue, for the last 1000 dispatched
+        """
+        with self._cond:
+            metrics = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                metrics[priority] = {
+                    'depth': sum(len(queue) for queue in self._queues[priority].values()),
+                    'jobs': len(self._queues[priority]),
+                    'dispatched': self._dispatched[priority],
+                    'retries': self._retries[priority],
+                    'mean_wait': statistics.mean(waits) if waits else 0,
+                    'p95_wait': waits[int(len(waits) * 0.95)] if waits else 0,
+                    'max_wait': waits[-1] if waits else 0,
+                }
+            metrics['in_flight'] = self._in_flight
+            return metrics
+
+_scheduler: FetchScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> FetchScheduler:
+    """
+        the global scheduler, made on first use
+        WFM_RATE_LIMIT (requests per second) can raise the rate limit, e.g. when the
+        API is the local price server (see server.py) instead of warframe market
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            rate = float(os.environ.get('WFM_RATE_LIMIT', 3))
+            _scheduler = FetchScheduler(rate=rate, burst=max(3, rate))
+        return _scheduler
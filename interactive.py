@@ -1,53 +1,72 @@
 import warframe_market as wfm
-import util
+import prefetch
+import fetch
 from prompt_toolkit import prompt, print_formatted_text, HTML
 from prompt_toolkit.completion import WordCompleter, CompleteEvent
 from prompt_toolkit.styles import Style
 from prompt_toolkit.document import Document
-from joblib import Parallel, delayed
-from tabulate import tabulate
-from tqdm import tqdm
+from typing import TYPE_CHECKING
+import os
 
-market_items = wfm.get_market_item_list()
-market_map = wfm.get_market_items_name_map(market_items)
+if TYPE_CHECKING:
+    import prime_sets
+    import relic
 
-def print_item_info(market_item_ls: list[wfm.MarketItem]):
-    wfm.prepare_market_items(market_item_ls)
+# oracle / relic / prime_sets / relic_plan (numpy), tabulate, joblib and tqdm are imported
+# by the functions that use them, so the prompt shows up sooner
+
+# the catalog, fetched by main_interactive (not at import)
+market_items: list[wfm.MarketItem] = []
+market_map: dict[str, wfm.MarketItem] = {}
+
+def print_item_info(market_item_ls: list[wfm.MarketItem], prefetcher: prefetch.Prefetcher | None = None):
+    import oracle
+    from tabulate import tabulate
+
+    if prefetcher is None:
+        wfm.prepare_market_items(market_item_ls)
+    else:
+        wfm.prepare_market_items(prefetcher.claim(market_item_ls))
 
     headers = ['Name', 'Plat(48hr)', 'R.Max Plat(48hr)', 'Volume(48hr)', 'WFM URL']
 
-    name_ls = []
-    plat_48hr_ls = []
-    vol_48hr_ls = []
-    url_ls = []
-    rmax_plat_48hr_ls = []
-    for item in market_item_ls:
-        name_ls.append(item.item_name)
-        plat_48hr_ls.append(item.price.get_oracle_price_48hrs())
-        vol_48hr_ls.append(item.statistic.get_volume_for_last_hours(48))
-        url_ls.append(item.get_wfm_url())
-        
-        if item.is_mod_info_available and item.is_mod:
-            rmax_plat_48hr_ls.append(item.price.get_oracle_price_48hrs(mod_rank_range=[item.mod_max_rank]))
-        else:
-            rmax_plat_48hr_ls.append(-1)
+    name_ls = [item.item_name for item in market_item_ls]
+    plat_48hr_ls = list(oracle.get_oracle_prices(market_item_ls))
+    vol_48hr_ls = [item.statistic.get_volume_for_last_hours(48) for item in market_item_ls]
+    url_ls = [item.get_wfm_url() for item in market_item_ls]
+
+    # max rank price, batched per max rank
+    rmax_plat_48hr_ls = [-1] * len(market_item_ls)
+    mod_ranks = {
+        item.mod_max_rank for item in market_item_ls
+        if item.is_mod_info_available and item.is_mod
+    }
+    for rank in mod_ranks:
+        idx_ls = [
+            i for i, item in enumerate(market_item_ls)
+            if item.is_mod_info_available and item.is_mod and item.mod_max_rank == rank
+        ]
+        prices = oracle.get_oracle_prices([market_item_ls[i] for i in idx_ls], mod_rank_range=[rank])
+        for i, price in zip(idx_ls, prices):
+            rmax_plat_48hr_ls[i] = price
 
     # do transpose
     table_ls = list(zip(name_ls, plat_48hr_ls, rmax_plat_48hr_ls, vol_48hr_ls, url_ls))
     print(tabulate(table_ls, headers=headers, tablefmt='rounded_outline'))
 
 def print_syndicate_info(syndicate_name: str):
+    import oracle
+    from tabulate import tabulate
+
     market_items = wfm.get_syndicate_items(syndicate_name)
 
-    def task(item: wfm.MarketItem):
-        item.prepare()
-        price = item.price.get_oracle_price_48hrs()
-        volume = item.statistic.get_volume_for_last_hours(48)
-        url = item.get_wfm_url()
-        return (item, price, volume, url)
-        
-    with util.tqdm_joblib(tqdm(range(len(market_items)), 'Fetching items...')) as tqdm_progress:
-        result = Parallel(n_jobs=5)(delayed(task)(item) for item in market_items)
+    # threads in this process, so everything goes through the one fetch scheduler (rate limit)
+    wfm.prepare_market_items(market_items)
+    prices = oracle.get_oracle_prices(market_items)
+    result = [
+        (item, float(price), item.statistic.get_volume_for_last_hours(48), item.get_wfm_url())
+        for item, price in zip(market_items, prices)
+    ]
 
     def print_all_item(item_ls: list[tuple[wfm.MarketItem, int, int, str]], prefix: str):
         item_ls = [(i[0].item_name, i[1], i[2], i[3]) for i in item_ls]
@@ -59,111 +78,184 @@ def print_syndicate_info(syndicate_name: str):
     print_formatted_text(HTML(f"Sorted by volume:"))
     print_all_item(sorted(result, key=lambda a:a[2], reverse=True)[:15], "    ")
 
-def print_relic_info(relic_data=None, level='Radiant'):
+def print_relic_info(relic_table: 'relic.RelicTable', level='Radiant'):
     """
-        relic data: dict{name: dict{rarity: list of valuables}}
-        rarity in ['Common', 'Uncommon', 'Rare'], all valuables should have an entry in market
-        do NOT include forma blueprint in your relic data
-
-        e.g., {
-            'Meso S14': {
-                'Common': ['Ankyros Prime Gauntlet', 'Burston Prime Stock'],
-                'Uncommon': ['Ember Prime Neuroptics Blueprint', 'Rhino Prime Neuroptics Blueprint'],
-                'Rare': ['Sicarus Prime Receiver']
-            }, 
-            ...
-        }
+        relic_table: rows of (relic, item, rarity, chance per refinement), see relic.RelicTable
+        all items should have an entry in market
+        do NOT include forma blueprint in your relic table (use relic_table.discard_items('Forma Blueprint'))
     """
+    import oracle
+    import relic
+    from tabulate import tabulate
 
-    def check_name_integrity(market_map, relics):
-        invalid_name = []
-        for name in relics:
-            for rarity in relics[name]:
-                for item_name in relics[name][rarity]:
-                    if item_name not in market_map:
-                        invalid_name.append(f'{name} {rarity} {item_name}')
-        if invalid_name: print(invalid_name)
-        return invalid_name
-    
-    market_map = wfm.get_market_items_name_map()
-    assert len(check_name_integrity(market_map, relic_data)) == 0
+    invalid_name = [
+        f'{relic_name} {rarity} {item_name}'
+        for relic_name, item_name, rarity, _ in relic_table.rows()
+        if item_name not in market_map
+    ]
+    if invalid_name: print(invalid_name)
+    assert len(invalid_name) == 0
 
-    def get_all_items(market_map, relics):
-        return [
-            market_map[item_name]
-            for name in relics for rarity in relics[name] for item_name in relics[name][rarity]
-        ]
-    
-    wfm.prepare_market_items(get_all_items(market_map, relic_data))
-
-    def get_relic_expected_price(relic_name, relic, level = 'Radiant'):
-        def get_expected_price(market_item: wfm.MarketItem):
-            return market_item.price.get_oracle_price_48hrs()
-        
-        prob_map = {
-            'Intact': {'Common': 0.253, 'Uncommon': 0.11, 'Rare': 0.02},
-            'Exceptional': {'Common': 0.233, 'Uncommon': 0.13, 'Rare': 0.04},
-            'Flawless': {'Common': 0.20, 'Uncommon': 0.17, 'Rare': 0.06},
-            'Radiant': {'Common': 0.167, 'Uncommon': 0.20, 'Rare': 0.10}
-        }[level]
-
-        
-        # get all info
-        expected_plat = 0
-
-        rarity_ls = []
-        name_ls = []
-        plat_ls = []
-        for rarity in prob_map:
-            for name in relic[rarity]:
-                rarity_ls.append(f'{rarity} ({prob_map[rarity] * 100}%)')
-                price = get_expected_price(market_map[name])
-                name_ls.append(name)
-                plat_ls.append(f'{price:.2f}')
-                expected_plat += prob_map[rarity] * price
-        
-        rarity_ls.append('Total')
-        name_ls.append('')
-        plat_ls.append(f'{expected_plat:.2f}')
+    item_ls = [market_map[item_name] for item_name in relic_table.item_names]
+    wfm.prepare_market_items(item_ls)
+    item_prices = oracle.get_oracle_prices(item_ls)
+    expected_plat_ls = relic_table.get_relic_expected_price(item_prices, level)
+
+    # get all info, rarity in order of common -> rare
+    level_idx = relic.REFINEMENTS.index(level)
+    table_ls = []
+    for relic_idx, relic_name in enumerate(relic_table.relic_names):
+        rows = sorted(
+            (i for i in range(len(relic_table)) if relic_table.relic[i] == relic_idx),
+            key=lambda i: relic_table.rarity[i]
+        )
+        rarity_ls = [
+            f'{relic.RARITIES[relic_table.rarity[i]]} ({relic_table.chance[i, level_idx] * 100:.2f}%)'
+            for i in rows
+        ] + ['Total']
+        name_ls = [relic_table.item_names[relic_table.item[i]] for i in rows] + ['']
+        plat_ls = [f'{item_prices[relic_table.item[i]]:.2f}' for i in rows] + [f'{expected_plat_ls[relic_idx]:.2f}']
 
         # make it actually tabulate-able, i.e. all list should be one string
         for i in range(len(rarity_ls)-1, 0, -1):
             if rarity_ls[i] == rarity_ls[i-1]:
                 rarity_ls[i] = ''
-        return [relic_name, '\n'.join(rarity_ls), '\n'.join(name_ls), '\n'.join(plat_ls)], expected_plat
-        
-    
-    relic_price = {relic_name: get_relic_expected_price(relic_name, relic_data[relic_name], level) for relic_name in relic_data}
+        table_ls.append([relic_name, '\n'.join(rarity_ls), '\n'.join(name_ls), '\n'.join(plat_ls)])
+
     print(tabulate(
-        [table_ls for relic_name, (table_ls, expected_plat) in relic_price.items()],
+        table_ls,
         headers=['Relic', 'Rarity', 'Name', 'Plat'], tablefmt="grid", colalign=("left",) * 3 + ("right",) 
     ))
     print(tabulate(
-        [[relic_name, expected_plat] for relic_name, (table_ls, expected_plat) in relic_price.items()],
+        [[relic_name, expected_plat] for relic_name, expected_plat in zip(relic_table.relic_names, expected_plat_ls)],
         headers=['Relic', 'Plat'], tablefmt="grid", colalign=("left", "right")
     ))
   
+def print_oracle_compare(market_item_ls: list[wfm.MarketItem]):
+    import oracle
+    from tabulate import tabulate
+
+    wfm.prepare_market_items(market_item_ls)
+
+    market = oracle.MarketMatrix.from_market_items(market_item_ls)
+    prices = oracle.evaluate_oracles(market)
+    category_prices = oracle.evaluate_by_category(market, [item.item_name for item in market_item_ls])
+
+    headers = ['Name', 'Category'] + list(prices.keys()) + ['Chosen']
+    table_ls = [
+        [item.item_name, oracle.get_item_category(item.item_name)]
+        + [f'{prices[name][i]:.2f}' for name in prices]
+        + [f'{category_prices[i]:.2f}']
+        for i, item in enumerate(market_item_ls)
+    ]
+    print(tabulate(table_ls, headers=headers, tablefmt='rounded_outline'))
+
 def item_function():
     item_selecter = WordCompleter(list(market_map.keys()) + ['Quit', 'quit'], 
                                   ignore_case=True, sentence=True, match_middle=True)
+    with prefetch.Prefetcher() as prefetcher:
+        prefetch_selecter = prefetch.PrefetchCompleter(item_selecter, prefetcher, market_map)
     
+        while True:
+            text = prompt('Enter item name (will match ALL items shown below. type "Quit" to quit): ', completer=prefetch_selecter)
+            if text in ['Quit', 'quit']:
+                break
+
+            completion_ls = list(item_selecter.get_completions(
+                Document(text), CompleteEvent(completion_requested=True)
+            ))
+            item_name_set = set(map(lambda c: c.text, completion_ls)) - {'Quit', 'quit'}
+            if len(item_name_set) == 0:
+                print_formatted_text(HTML('Item not found.'))
+                continue
+
+            print_item_info([
+                market_map[item_name]
+                for item_name in item_name_set
+            ], prefetcher)
+            prefetcher.reset_budget()
+
+def print_prime_set_info(set_index: 'prime_sets.SetIndex'):
+    import prime_sets
+    from tabulate import tabulate
+
+    valuation = prime_sets.value_sets(set_index)
+
+    def print_sets(idx_ls: list[int]):
+        print(tabulate([
+            [valuation.sets[i].item_name, f'{valuation.set_price[i]:.2f}', f'{valuation.parts_price[i]:.2f}',
+             f'{valuation.margin[i]:.2f}', valuation.set_volume[i], valuation.volume[i], valuation.sets[i].get_wfm_url()]
+            for i in idx_ls
+        ], headers=('Name', 'Set Plat', 'Parts Plat', 'Margin', 'Set Volume', 'Min Volume', 'URL'),
+           tablefmt='rounded_outline', colalign=('left',) + ('right',) * 5 + ('left',)))
+
+    print_formatted_text(HTML(f"Sorted by margin (set - parts):"))
+    print_sets(valuation.ranked('margin')[:15])
+    print_formatted_text(HTML(f""))
+    print_formatted_text(HTML(f"Sorted by volume (lowest of set and parts):"))
+    print_sets(valuation.ranked('volume')[:15])
+
+def prime_set_function():
+    import numpy as np
+    import prime_sets
+
+    set_index = prime_sets.SetIndex.from_market_items(market_items)
+    if set_index.n_sets == 0:
+        print_formatted_text(HTML('No prime sets found in the market catalog (no set info, and no items tagged "set").'))
+        return
+    set_names = [item.item_name for item in set_index.get_set_items()]
+    set_selecter = WordCompleter(set_names + ['All', 'Quit', 'quit'], ignore_case=True, sentence=True, match_middle=True)
+
     while True:
-        text = prompt('Enter item name (will match ALL items shown below. type "Quit" to quit): ', completer=item_selecter)
+        text = prompt('Enter set name (will match ALL sets shown below. type "All" for every prime set, "Quit" to quit): ',
+                      completer=set_selecter)
         if text in ['Quit', 'quit']:
             break
+        substr = '' if text == 'All' else text.lower()
+        set_mask = np.array([substr in name.lower() for name in set_names], dtype=bool)
+        if not set_mask.any():
+            print_formatted_text(HTML('Set not found.'))
+            continue
+        print_prime_set_info(set_index.select(set_mask))
+
+def oracle_function():
+    import oracle
+    from tabulate import tabulate
 
-        completion_ls = list(item_selecter.get_completions(
-            Document(text), CompleteEvent(completion_requested=True)
+    def print_current():
+        print(tabulate(
+            [[category, oracle_name, oracle.oracle_registry[oracle_name].description]
+             for category, oracle_name in oracle.category_oracle_map.items()],
+            headers=['Category', 'Oracle', 'Description'], tablefmt='rounded_outline'
         ))
-        item_name_set = set(map(lambda c: c.text, completion_ls)) - {'Quit', 'quit'}
-        if len(item_name_set) == 0:
-            print_formatted_text(HTML('Item not found.'))
-            continue
 
-        print_item_info([
-            market_map[item_name]
-            for item_name in item_name_set
-        ])
+    category_selecter = WordCompleter(list(oracle.category_oracle_map.keys()) + ['Compare', 'Quit', 'quit'],
+                                      ignore_case=True, sentence=True, match_middle=True)
+    oracle_selecter = WordCompleter(list(oracle.oracle_registry.keys()), 
+                                    ignore_case=True, sentence=True, match_middle=True)
+    while True:
+        print_current()
+        text = prompt('Enter category to change its oracle (type "Compare" to compare oracles, "Quit" to quit): ',
+                      completer=category_selecter)
+        if text in ['Quit', 'quit']:
+            break
+        elif text == 'Compare':
+            item_text = prompt('Enter item name (will match ALL items shown below): ', completer=WordCompleter(
+                list(market_map.keys()), ignore_case=True, sentence=True, match_middle=True
+            ))
+            item_name_set = {name for name in market_map if item_text.lower() in name.lower()}
+            if len(item_name_set) == 0:
+                print_formatted_text(HTML('Item not found.'))
+                continue
+            print_oracle_compare([market_map[item_name] for item_name in item_name_set])
+        elif text not in oracle.category_oracle_map:
+            print_formatted_text(HTML('Category not found.'))
+        else:
+            oracle_name = prompt(f'Enter oracle for "{text}": ', completer=oracle_selecter)
+            if oracle_name not in oracle.oracle_registry:
+                print_formatted_text(HTML('Oracle not found.'))
+            else:
+                oracle.category_oracle_map[text] = oracle_name
 
 def syndicate_function():
     syndicate_ls = [
@@ -183,13 +275,14 @@ def syndicate_function():
             print_syndicate_info(text)
 
 def relic_plat_function():
-    from data.relic_data import relic_data_map, relic_set_map
+    from data.relic_data import relic_set_map
+    import relic
 
-    all_relic_data_map = relic_data_map | wfm.get_relic_data(discard_forma=True)
+    all_relic_table = relic.get_all_relic_table(discard_forma=True)
 
     relic_choice = relic_set_map | {
         relic_name: [relic_name]
-        for relic_name in all_relic_data_map
+        for relic_name in all_relic_table.relic_names
     }
     syndicate_selecter = WordCompleter(list(relic_choice.keys()) + ['Quit', 'quit'], ignore_case=True)
     while True:
@@ -199,23 +292,12 @@ def relic_plat_function():
         elif text not in relic_choice:
             print_formatted_text(HTML('Relic not found.'))
         else:
-            relic_name_ls = relic_choice[text]
-            print_relic_info({
-                relic_name: all_relic_data_map[relic_name]
-                for relic_name in relic_name_ls
-            })
+            print_relic_info(all_relic_table.select_relics(relic_choice[text]))
 
 def relic_item_function():
-    from data.relic_data import relic_data_map
-
-    def name_in_relic(relic_data: dict[str, list[str]], substr: str):
-        for rarity in relic_data:
-            for item_name in relic_data[rarity]:
-                if substr.lower() in item_name.lower():
-                    return True
-        return False
-    
-    all_relic_data_map = relic_data_map | wfm.get_relic_data(discard_forma=True)
+    import relic
+
+    all_relic_table = relic.get_all_relic_table(discard_forma=True)
 
     item_selecter = WordCompleter(list(market_map.keys()) + ['Quit', 'quit'], 
                                   ignore_case=True, sentence=True, match_middle=True)
@@ -225,11 +307,23 @@ def relic_item_function():
         if text in ['Quit', 'quit']:
             break
         else:
-            print_relic_info({
-                relic_name: relic_data
-                for relic_name, relic_data in all_relic_data_map.items()
-                if name_in_relic(relic_data, text)
-            })
+            print_relic_info(all_relic_table.select_relics_with_item(text))
+
+def relic_plan_function():
+    import relic_plan
+
+    while True:
+        text = prompt('Enter inventory file path (json, {relic name: count}. type "Quit" to quit): ')
+        if text in ['Quit', 'quit']:
+            break
+        if not os.path.exists(text):
+            print_formatted_text(HTML('File not found.'))
+            continue
+        traces = prompt('Enter void traces budget: ')
+        if not traces.isdigit():
+            print_formatted_text(HTML('Not a number.'))
+            continue
+        relic_plan.print_relic_plan(relic_plan.plan_inventory(relic_plan.load_inventory(text), int(traces), market_map=market_map))
 
 def quit_function():
     exit()
@@ -252,7 +346,10 @@ def print_welcome_message():
     P('<bp>-</bp> <item>Item Info</item>: Show item info')
     P('<bp>-</bp> <item>Relic Plat</item>: Gives expected plat for specific relic (set)')
     P('<bp>-</bp> <item>Relic Item</item>: Get all relics containing item and give expected plat')
+    P('<bp>-</bp> <item>Relic Plan</item>: Decide which owned relics to sell / open / refine')
     P('<bp>-</bp> <item>Syndicate</item>: Show syndicate item market price')
+    P('<bp>-</bp> <item>Prime Set</item>: Compare prime set price to the sum of its parts')
+    P('<bp>-</bp> <item>Oracle</item>: Choose / compare price oracle per item category')
     P('')
     P('<subtitle>Note:</subtitle>')
     P('<bp>-</bp> Press <code>TAB</code> to use autocomplete menu, or just type away.')
@@ -263,11 +360,18 @@ def print_welcome_message():
     P('')
 
 def main_interactive():
+    global market_items, market_map
+    market_items = wfm.get_market_item_list()
+    market_map = wfm.get_market_items_name_map(market_items)
+
     function = {
         'Item Info': item_function,
         'Relic Plat': relic_plat_function,
         'Relic Item': relic_item_function,
+        'Relic Plan': relic_plan_function,
         'Syndicate': syndicate_function,
+        'Prime Set': prime_set_function,
+        'Oracle': oracle_function,
         'Quit': quit_function,
         'quit': quit_function
     }
@@ -280,4 +384,8 @@ def main_interactive():
         elif text not in function:
             print_formatted_text(HTML('Function not found.'))
         else:
-            function[text]()
\ No newline at end of file
+            try:
+                function[text]()
+            except fetch.FetchError as e:
+                # a 404, or still too many requests after retrying, just go back to the prompt
+                print_formatted_text(f'Fetch failed ({e}), try again later.')
\ No newline at end of file
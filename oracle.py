@@ -0,0 +1,308 @@
+"""
+    named price oracle strategies, evaluated in batch over many items at once
+
+    everything here works on an items x timeslots matrix (`StatMatrix`) and
+    an items x orders matrix (`OrderMatrix`), so comparing several oracles over
+    the whole market is one numpy pass per oracle instead of one python loop per item
+"""
+from dataclasses import dataclass, field
+from typing import Callable
+import datetime
+
+import numpy as np
+
+from data.oracle_data import category_oracle_map as _default_category_oracle_map
+from data.oracle_data import item_category_map as _default_item_category_map
+
+class StatMatrix:
+    """
+        items x timeslots matrix of closed statistics.
+        rows are padded with volume 0, and padded slots are never valid.
+
+        - median, volume: the stat of that timeslot
+        - age: how many hours before the row's basis time that timeslot is
+        - valid: whether the slot exists and is not after the basis time
+    """
+    def __init__(self, median: np.ndarray, volume: np.ndarray, age: np.ndarray, valid: np.ndarray):
+        self.median = median
+        self.volume = volume
+        self.age = age
+        self.valid = valid
+
+    @property
+    def n_items(self):
+        return self.median.shape[0]
+
+    @classmethod
+    def from_statistics(cls, statistic_ls: list, timeframe: str = '48hours',
+                        basis_time: datetime.datetime | None = None,
+                        mod_rank_range: list | range = [0], subtype: str | None = None):
+        """
+            statistic_ls: list of Statistic
+            basis_time is chosen per row the same way Statistic.get_stat_for_last_hours does
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        rows = []
+        for statistic in statistic_ls:
+            cur_basis = basis_time or statistic.basis_time or now
+            rows.append([
+                (stat['median'], stat['volume'], (cur_basis - stat['datetime']).total_seconds() / 3600)
+                for stat in statistic.statistics['statistics_closed'][timeframe]
+                if stat['mod_rank'] in mod_rank_range and (subtype is None or stat['subtype'] in [None, subtype])
+            ])
+
+        width = max([len(row) for row in rows] + [1])
+        median = np.zeros((len(rows), width))
+        volume = np.zeros((len(rows), width))
+        age = np.full((len(rows), width), np.inf)
+        for i, row in enumerate(rows):
+            if row:
+                median[i, :len(row)], volume[i, :len(row)], age[i, :len(row)] = zip(*row)
+        return cls(median, volume, age, np.isfinite(age) & (age >= 0))
+
+    def window(self, hours: float):
+        "mask of the slots in the last {hours} hours"
+        return self.valid & (self.age < hours)
+
+class OrderMatrix:
+    """
+        items x orders matrix of ingame, visible orders in the given mod rank range.
+        unusable / padded entries have platinum NaN.
+    """
+    def __init__(self, sell: np.ndarray, buy: np.ndarray):
+        self.sell = sell
+        self.buy = buy
+
+    @classmethod
+    def from_orders(cls, orders_ls: list, mod_rank_range: list | range = [0], subtype: str | None = None):
+        """
+            orders_ls: list of Orders
+            subtype: same as Statistic's, None for every subtype
+        """
+        def to_matrix(price_rows):
+            width = max([len(row) for row in price_rows] + [1])
+            matrix = np.full((len(price_rows), width), np.nan)
+            for i, row in enumerate(price_rows):
+                matrix[i, :len(row)] = row
+            return matrix
+
+        sell_rows, buy_rows = [], []
+        for orders in orders_ls:
+            usable = [
+                order for order in orders.orders
+                if order.visible and order.is_ingame and order.mod_rank in mod_rank_range
+                and (subtype is None or order.subtype in [None, subtype])
+            ]
+            sell_rows.append([order.platinum for order in usable if order.is_sell])
+            buy_rows.append([order.platinum for order in usable if order.is_buy])
+        return cls(to_matrix(sell_rows), to_matrix(buy_rows))
+
+@dataclass
+class MarketMatrix:
+    """
+        what an oracle strategy gets to look at. orders may be None
+        if the strategy doesn't need them
+    """
+    stats: StatMatrix
+    orders: OrderMatrix | None = None
+
+    @classmethod
+    def from_data(cls, statistic_ls: list, orders_ls: list | None = None,
+                  timeframe: str = '48hours', **stat_filter):
+        """
+            stat_filter: same as Statistic, i.e. basis_time, mod_rank_range and subtype
+        """
+        stats = StatMatrix.from_statistics(statistic_ls, timeframe, **stat_filter)
+        orders = None
+        if orders_ls is not None:
+            orders = OrderMatrix.from_orders(orders_ls, stat_filter.get('mod_rank_range', [0]), stat_filter.get('subtype'))
+        return cls(stats, orders)
+
+    @classmethod
+    def from_market_items(cls, market_items: list, **stat_filter):
+        """
+            market_items must be prepare()-ed first
+        """
+        return cls.from_data(
+            [item.statistic for item in market_items],
+            [item.orders for item in market_items],
+            **stat_filter
+        )
+
+    def take(self, rows: np.ndarray):
+        "sub-matrix with only the given rows"
+        stats = StatMatrix(self.stats.median[rows], self.stats.volume[rows],
+                           self.stats.age[rows], self.stats.valid[rows])
+        orders = None
+        if self.orders is not None:
+            orders = OrderMatrix(self.orders.sell[rows], self.orders.buy[rows])
+        return MarketMatrix(stats, orders)
+
+"""
+    Batched building blocks.
+    All of them returns an array of price per item, and 0 if there is no data for that item
+    (same as what PriceOracle does)
+"""
+
+def _top_ratio_units(stats: StatMatrix, hours: float, ratio: float):
+    """
+        expand every timeslot into {volume} deals of {median} plat, sort descending
+        and pick the top `ratio` of them, like PriceOracle.get_top_k_*_for_last_hours.
+        the expansion is never materialized, we just count how many deals to take from each slot.
+
+        return (sorted prices, sorted volume, cumulative volume, deals taken per slot, k per item)
+    """
+    volume = np.where(stats.window(hours), stats.volume, 0)
+    order = np.argsort(np.where(volume > 0, -stats.median, np.inf), axis=1, kind='stable')
+    price = np.take_along_axis(stats.median, order, axis=1)
+    volume = np.take_along_axis(volume, order, axis=1)
+
+    total = volume.sum(axis=1)
+    k = np.floor(total * ratio)
+    k = np.where(k == 0, total, k)  # not enough deals, use all of them
+    cumsum = np.cumsum(volume, axis=1)
+    taken = np.clip(k[:, None] - (cumsum - volume), 0, volume)
+    return price, volume, cumsum, taken, k
+
+def top_ratio_mean(market: MarketMatrix, hours: float = 48, ratio: float = 0.3):
+    """
+        mean price of the top `ratio` deals in the last {hours} hours, weighted by volume
+        batched PriceOracle.get_top_k_avg_price_for_last_hours
+    """
+    price, _, _, taken, k = _top_ratio_units(market.stats, hours, ratio)
+    total = (price * taken).sum(axis=1)
+    return np.divide(total, k, out=np.zeros_like(total), where=k > 0)
+
+def volume_weighted_median(market: MarketMatrix, hours: float = 48, ratio: float = 1):
+    """
+        median price of the top `ratio` deals in the last {hours} hours, weighted by volume
+        batched PriceOracle.get_top_k_median_price_for_last_hours
+    """
+    price, _, cumsum, _, k = _top_ratio_units(market.stats, hours, ratio)
+    k = k.astype(int)
+
+    def price_at(deal_index):
+        slot = np.argmax(cumsum > deal_index[:, None], axis=1)
+        return np.take_along_axis(price, slot[:, None], axis=1)[:, 0]
+
+    median = (price_at((k - 1) // 2) + price_at(k // 2)) / 2
+    return np.where(k > 0, median, 0)
+
+def order_book(market: MarketMatrix, side: str = 'sell', k: int = 1):
+    """
+        mean of the best k ingame orders, i.e. the lowest sells or the highest buys
+    """
+    if market.orders is None:
+        raise ValueError('order_book oracle needs orders')
+    if side == 'sell':
+        prices = np.sort(market.orders.sell, axis=1)[:, :k]  # NaN sorts to the end
+    else:
+        prices = -np.sort(-market.orders.buy, axis=1)[:, :k]
+    count = np.sum(~np.isnan(prices), axis=1)
+    total = np.nansum(prices, axis=1)
+    return np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+def fallback_chain(market: MarketMatrix, windows: tuple = ((3, 1), (48, 0.3)),
+                   order_side: str | None = 'buy'):
+    """
+        try top_ratio_mean for every (hours, ratio) in windows in order,
+        and fallback to the order book if every window has no deals.
+        order_side: None to not look at the order book at all
+    """
+    price = np.zeros(market.stats.n_items)
+    for hours, ratio in windows:
+        price = np.where(price > 0, price, top_ratio_mean(market, hours, ratio))
+    if order_side is not None:
+        price = np.where(price > 0, price, order_book(market, order_side))
+    return price
+
+"""
+    The registry. Add your own with register_oracle()
+"""
+
+@dataclass
+class OracleStrategy:
+    name: str
+    func: Callable[..., np.ndarray]
+    params: dict = field(default_factory=dict)
+    description: str = ''
+    need_orders: bool = False
+
+    def evaluate(self, market: MarketMatrix) -> np.ndarray:
+        return self.func(market, **self.params)
+
+oracle_registry: dict[str, OracleStrategy] = {}
+
+def register_oracle(name: str, func: Callable[..., np.ndarray], description: str = '',
+                    need_orders: bool = False, **params):
+    """
+        func(market: MarketMatrix, **params) -> price per item
+    """
+    oracle_registry[name] = OracleStrategy(name, func, params, description, need_orders)
+    return oracle_registry[name]
+
+register_oracle('top_ratio_mean', top_ratio_mean, 'mean of top 30% deals (48hr)', hours=48, ratio=0.3)
+register_oracle('volume_weighted_median', volume_weighted_median, 'median of all deals (48hr)', hours=48, ratio=1)
+register_oracle('fallback_chain', fallback_chain, 'last 3hr, else top 30% (48hr), else highest buy',
+                need_orders=True, windows=((3, 1), (48, 0.3)), order_side='buy')
+register_oracle('order_book', order_book, 'lowest ingame sell order', need_orders=True, side='sell', k=1)
+register_oracle('fresh_prime', fallback_chain, 'last 3hr, else last 12hr, else lowest sell',
+                need_orders=True, windows=((3, 1), (12, 1)), order_side='sell')
+register_oracle('equilibrium', volume_weighted_median, 'median of all deals (48hr)', hours=48, ratio=1)
+
+"""
+    Category selection. Which strategy an item uses is decided by its category.
+    Change these maps (or use the Oracle function in the CLI) to change the oracle
+"""
+
+category_oracle_map: dict[str, str] = dict(_default_category_oracle_map)
+item_category_map: dict[str, str] = dict(_default_item_category_map)
+
+def get_item_category(item_name: str) -> str:
+    """
+        item_category_map can have either the full item name or a prefix of it,
+        e.g. 'Sevagoth Prime' matches 'Sevagoth Prime Neuroptics Blueprint'
+    """
+    if item_name in item_category_map:
+        return item_category_map[item_name]
+    for prefix, category in item_category_map.items():
+        if item_name.startswith(prefix + ' '):
+            return category
+    return 'default'
+
+def get_category_oracle(category: str) -> OracleStrategy:
+    return oracle_registry[category_oracle_map.get(category, category_oracle_map['default'])]
+
+def evaluate_oracles(market: MarketMatrix, oracle_names: list[str] | None = None) -> dict[str, np.ndarray]:
+    """
+        evaluate several oracles over the same market in one pass
+        oracle_names: None for every registered oracle
+    """
+    if oracle_names is None:
+        oracle_names = list(oracle_registry.keys())
+        if market.orders is None:
+            oracle_names = [name for name in oracle_names if not oracle_registry[name].need_orders]
+    return {name: oracle_registry[name].evaluate(market) for name in oracle_names}
+
+def evaluate_by_category(market: MarketMatrix, item_names: list[str]) -> np.ndarray:
+    """
+        evaluate each item with the oracle of its category
+        item_names: the row names of market, to decide the category
+    """
+    categories = np.array([get_item_category(name) for name in item_names])
+    price = np.zeros(market.stats.n_items)
+    for category in np.unique(categories):
+        rows = np.flatnonzero(categories == category)
+        price[rows] = get_category_oracle(category).evaluate(market.take(rows))
+    return price
+
+def get_oracle_prices(market_items: list, oracle_name: str | None = None, **stat_filter) -> np.ndarray:
+    """
+        batched version of PriceOracle.get_oracle_price
+        market_items must be prepare()-ed first
+        oracle_name: None to decide by item category
+    """
+    market = MarketMatrix.from_market_items(market_items, **stat_filter)
+    if oracle_name is None:
+        return evaluate_by_category(market, [item.item_name for item in market_items])
+    return oracle_registry[oracle_name].evaluate(market)
@@ -0,0 +1,122 @@
+"""
+    speculative prefetch while the user is still typing
+
+    the completer already knows which items are still matching on every keystroke,
+    so once there are only a few of them left, start prepare()-ing them in the background.
+    by the time ENTER is pressed most of them are already fetched.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import time
+
+from prompt_toolkit.completion import Completer, CompleteEvent
+from prompt_toolkit.document import Document
+
+import warframe_market as wfm
+
+class Prefetcher:
+    def __init__(self, max_candidates: int = 8, budget: int = 40, max_workers: int = 2, max_age: float = 60):
+        """
+            max_candidates: only start prefetching when that many items are still matching
+            budget: max items prefetched per query, see reset_budget()
+            max_workers: max items being prefetched at the same time
+            max_age: seconds, prefetched items older than that are fetched again
+        """
+        self.max_candidates = max_candidates
+        self.budget = budget
+        self.max_age = max_age
+        self.used = 0
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._futures: dict[str, Future] = {}       # item name -> future of prefetch task
+        self._done_at: dict[str, float] = {}        # item name -> when it was prefetched
+
+    def close(self):
+        "stop the worker threads, prefetches that haven't started are dropped"
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _task(self, item: wfm.MarketItem):
+        item.prepare(priority='prefetch', job='prefetch')
+        with self._lock:
+            self._done_at[item.item_name] = time.monotonic()
+
+    def _is_fresh(self, item_name: str):
+        "must hold self._lock"
+        return item_name in self._done_at and time.monotonic() - self._done_at[item_name] < self.max_age
+
+    def update(self, candidates: list[wfm.MarketItem]):
+        """
+            called on every keystroke with the items still matching, must be fast.
+            cancel prefetches that are no longer matching and haven't started,
+            start the new ones if there are few enough candidates.
+        """
+        wanted = candidates[:self.max_candidates] if len(candidates) <= self.max_candidates else []
+        wanted_names = {item.item_name for item in wanted}
+        with self._lock:
+            for item_name, future in list(self._futures.items()):
+                if item_name not in wanted_names and future.cancel():
+                    del self._futures[item_name]
+                    self.used -= 1
+
+            for item in wanted:
+                if self.used >= self.budget:
+                    break
+                future = self._futures.get(item.item_name)
+                if (future is not None and not future.done()) or self._is_fresh(item.item_name):
+                    continue
+                self._futures[item.item_name] = self._executor.submit(self._task, item)
+                self.used += 1
+
+    def claim(self, items: list[wfm.MarketItem]) -> list[wfm.MarketItem]:
+        """
+            called when the items are actually needed.
+            waits for the ones being prefetched right now, and cancels the ones not started yet.
+
+            return the items that still need to be prepare()-ed
+        """
+        with self._lock:
+            running = []
+            for item in items:
+                future = self._futures.get(item.item_name)
+                if future is not None and not future.cancel():
+                    running.append(future)
+
+        for future in running:
+            try:
+                future.result()
+            except Exception:
+                pass    # just fetch it again
+
+        with self._lock:
+            return [item for item in items if not self._is_fresh(item.item_name)]
+
+    def reset_budget(self):
+        "call after each query"
+        with self._lock:
+            self._futures = {name: future for name, future in self._futures.items() if not future.done()}
+            self.used = len(self._futures)
+
+class PrefetchCompleter(Completer):
+    """
+        wraps another completer, every time the completions are asked for (i.e. every keystroke
+        with complete_while_typing), tell the prefetcher what is still matching
+    """
+    def __init__(self, completer: Completer, prefetcher: Prefetcher, market_map: dict[str, wfm.MarketItem]):
+        self.completer = completer
+        self.prefetcher = prefetcher
+        self.market_map = market_map
+
+    def get_completions(self, document: Document, complete_event: CompleteEvent):
+        completions = list(self.completer.get_completions(document, complete_event))
+        if document.text:
+            self.prefetcher.update([
+                self.market_map[c.text] for c in completions if c.text in self.market_map
+            ])
+        yield from completions
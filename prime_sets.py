@@ -0,0 +1,169 @@
+"""
+    is the set worth more than its parts?
+
+    build a set -> parts index out of the catalog instead of writing lists like data.relic_data by hand,
+    then fetch every set and part once and compare them all at once with numpy.
+
+    the per item v2 json says which items are a set (setRoot) and what is in it (setParts, quantityInSet),
+    but the /v2/items list may not carry those, so without them sets are found by name (see find_set_parts)
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import warframe_market as wfm
+import oracle
+
+def is_prime_set(item: wfm.MarketItem):
+    if item.tags:
+        return 'prime' in item.tags
+    return 'Prime' in item.item_name
+
+def find_set_parts(market_items: list[wfm.MarketItem]) -> dict[str, list[wfm.MarketItem]]:
+    """
+        set item id -> its parts (not including the set)
+        uses setRoot / setParts if any item in the catalog has them. else by name: a set is tagged 'set'
+        (or named "... Set"), and its parts are the other items named "<set name without Set> ...",
+        every part counts once then (quantity_in_set is 1)
+    """
+    id_map = {item.id: item for item in market_items}
+    if any(item.set_parts for item in market_items):
+        return {
+            item.id: [id_map[part_id] for part_id in item.set_parts if part_id != item.id and part_id in id_map]
+            for item in market_items if item.is_set_root
+        }
+
+    sets = [item for item in market_items if 'set' in item.tags or item.item_name.endswith(' Set')]
+    prefix_map = {item.item_name.removesuffix(' Set'): item.id for item in sets}
+    set_parts = {item.id: [] for item in sets}
+    for part in market_items:
+        if part.id in set_parts:
+            continue
+        words = part.item_name.split(' ')
+        for n_words in range(len(words) - 1, 0, -1):    # longest, so "Dual Kamas Prime ..." is not "Kamas Prime"
+            prefix = ' '.join(words[:n_words])
+            if prefix in prefix_map:
+                set_parts[prefix_map[prefix]].append(part)
+                break
+    return set_parts
+
+class SetIndex:
+    """
+        compact set -> parts index
+            - items: every set and part, deduped
+            - set_item: index into items, one per set
+            - part_set, part_item, part_quantity: one per (set, part), index into sets / items,
+              and how many of that part the set needs
+    """
+    def __init__(self, items: list[wfm.MarketItem], set_item: np.ndarray,
+                 part_set: np.ndarray, part_item: np.ndarray, part_quantity: np.ndarray):
+        self.items = items
+        self.set_item = set_item
+        self.part_set = part_set
+        self.part_item = part_item
+        self.part_quantity = part_quantity
+
+    @property
+    def n_sets(self):
+        return len(self.set_item)
+
+    @classmethod
+    def from_market_items(cls, market_items: list[wfm.MarketItem], set_filter=is_prime_set):
+        """
+            market_items: the whole catalog (v2), parts are looked up in here
+            set_filter: which sets to keep
+        """
+        set_parts = find_set_parts(market_items)
+        items, item_index = [], {}
+
+        def index_of(item: wfm.MarketItem):
+            if item.id not in item_index:
+                item_index[item.id] = len(items)
+                items.append(item)
+            return item_index[item.id]
+
+        set_item, part_set, part_item, part_quantity = [], [], [], []
+        for item in market_items:
+            if item.id not in set_parts or not set_filter(item):
+                continue
+            parts = set_parts[item.id]
+            if not parts:
+                continue
+            for part in parts:
+                part_set.append(len(set_item))
+                part_item.append(index_of(part))
+                part_quantity.append(part.quantity_in_set)
+            set_item.append(index_of(item))
+
+        return cls(items, np.array(set_item, dtype=np.int32), np.array(part_set, dtype=np.int32),
+                   np.array(part_item, dtype=np.int32), np.array(part_quantity, dtype=float))
+
+    def select(self, set_mask: np.ndarray) -> 'SetIndex':
+        "only keep the sets in set_mask (bool array), items are not re-indexed"
+        new_set = np.cumsum(set_mask) - 1
+        part_mask = set_mask[self.part_set]
+        return SetIndex(self.items, self.set_item[set_mask], new_set[self.part_set[part_mask]],
+                        self.part_item[part_mask], self.part_quantity[part_mask])
+
+    def get_set_items(self) -> list[wfm.MarketItem]:
+        return [self.items[i] for i in self.set_item]
+
+    def get_needed_items(self) -> list[wfm.MarketItem]:
+        "every item used by the sets left, deduped"
+        return [self.items[i] for i in np.unique(np.concatenate([self.set_item, self.part_item]))]
+
+@dataclass
+class SetValuation:
+    """
+        one entry per set, in the same order as SetIndex.set_item
+        margin > 0 means the set is worth more than its parts
+        volume is the lowest 48hr volume among the set and its parts, i.e. how easy it is to actually do
+    """
+    sets: list[wfm.MarketItem]
+    set_price: np.ndarray
+    parts_price: np.ndarray
+    margin: np.ndarray
+    set_volume: np.ndarray
+    volume: np.ndarray
+    priced: np.ndarray      # the set and every part has a price
+
+    def ranked(self, key: str = 'margin') -> list[int]:
+        "indices of priced sets, best first. key in ['margin', 'volume']"
+        secondary = self.volume if key == 'margin' else self.margin
+        order = np.lexsort((-secondary, -getattr(self, key)))
+        return [i for i in order if self.priced[i]]
+
+def value_sets(set_index: SetIndex, priority: str = 'interactive') -> SetValuation:
+    """
+        fetch every set and part once (deduped), then value them all at once
+    """
+    items = set_index.items
+    needed = set_index.get_needed_items()
+    wfm.prepare_market_items(needed, priority=priority, job='prime sets')
+
+    prices = np.zeros(len(items))
+    volumes = np.zeros(len(items))
+    needed_idx = np.array([i for i, item in enumerate(items) if item.statistic is not None], dtype=np.int64)
+    prices[needed_idx] = oracle.get_oracle_prices([items[i] for i in needed_idx])
+    volumes[needed_idx] = [items[i].statistic.get_volume_for_last_hours(48) for i in needed_idx]
+
+    n_sets = set_index.n_sets
+    set_price = prices[set_index.set_item]
+    parts_price = np.bincount(set_index.part_set, weights=prices[set_index.part_item] * set_index.part_quantity,
+                              minlength=n_sets)
+
+    parts_volume = np.full(n_sets, np.inf)
+    np.minimum.at(parts_volume, set_index.part_set, volumes[set_index.part_item])
+    parts_min_price = np.full(n_sets, np.inf)
+    np.minimum.at(parts_min_price, set_index.part_set, prices[set_index.part_item])
+
+    set_volume = volumes[set_index.set_item]
+    return SetValuation(
+        sets=set_index.get_set_items(),
+        set_price=set_price,
+        parts_price=parts_price,
+        margin=set_price - parts_price,
+        set_volume=set_volume,
+        volume=np.minimum(set_volume, parts_volume),
+        priced=(set_price > 0) & (parts_min_price > 0),
+    )
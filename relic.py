@@ -0,0 +1,297 @@
+"""
+    relic drop table from drops.warframestat.us, parsed once and cached
+
+    the table has one row per (relic, item) of the Intact relic, with the exact
+    drop chance of every refinement level. it is saved in cache/relics.json
+    together with the hash drops.warframestat.us gives in info.json, so
+    it is only downloaded again when the drop data changes.
+    the cache is used as is for RELIC_CACHE_TTL, only after that info.json is asked again.
+"""
+import codecs
+import json
+import os
+import time
+from typing import Iterable, Iterator
+
+import numpy as np
+
+REFINEMENTS = ['Intact', 'Exceptional', 'Flawless', 'Radiant']
+RARITIES = ['Common', 'Uncommon', 'Rare']
+
+# drop chance per item of each rarity, for relic data that don't have exact chances
+# (e.g. data.relic_data, which only lists items per rarity)
+RARITY_CHANCES = {
+    'Intact': {'Common': 0.253, 'Uncommon': 0.11, 'Rare': 0.02},
+    'Exceptional': {'Common': 0.233, 'Uncommon': 0.13, 'Rare': 0.04},
+    'Flawless': {'Common': 0.20, 'Uncommon': 0.17, 'Rare': 0.06},
+    'Radiant': {'Common': 0.167, 'Uncommon': 0.20, 'Rare': 0.10}
+}
+
+RELIC_URL = 'https://drops.warframestat.us/data/relics.json'
+INFO_URL = 'https://drops.warframestat.us/data/info.json'
+RELIC_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'relics.json')
+RELIC_CACHE_TTL = 24 * 60 * 60  # seconds, drop data changes with game updates, not that often
+
+class RelicTable:
+    """
+        columns, one entry per row:
+            - relic: index into relic_names
+            - item: index into item_names
+            - rarity: index into RARITIES
+            - chance: (rows, 4) array, drop chance (0~1) for each level in REFINEMENTS
+    """
+    def __init__(self, relic_names: list[str], item_names: list[str],
+                 relic: np.ndarray, item: np.ndarray, rarity: np.ndarray, chance: np.ndarray):
+        self.relic_names = relic_names
+        self.item_names = item_names
+        self.relic = relic
+        self.item = item
+        self.rarity = rarity
+        self.chance = chance
+
+    def __len__(self):
+        return len(self.relic)
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple[str, str, str, list[float]]]):
+        """
+            rows: list of (relic name, item name, rarity, [chance for each level in REFINEMENTS])
+        """
+        relic_names = list(dict.fromkeys(row[0] for row in rows))
+        item_names = list(dict.fromkeys(row[1] for row in rows))
+        relic_index = {name: i for i, name in enumerate(relic_names)}
+        item_index = {name: i for i, name in enumerate(item_names)}
+        return cls(
+            relic_names, item_names,
+            np.array([relic_index[row[0]] for row in rows], dtype=np.int32),
+            np.array([item_index[row[1]] for row in rows], dtype=np.int32),
+            np.array([RARITIES.index(row[2]) for row in rows], dtype=np.int8),
+            np.array([row[3] for row in rows], dtype=float).reshape(-1, len(REFINEMENTS)),
+        )
+
+    @classmethod
+    def from_relic_data_map(cls, relic_data_map: dict[str, dict[str, list[str]]]):
+        """
+            relic_data_map: {relic name -> {rarity: list of items}}, like data.relic_data.relic_data_map
+            chances are RARITY_CHANCES
+        """
+        return cls.from_rows([
+            (relic_name, item_name, rarity, [RARITY_CHANCES[level][rarity] for level in REFINEMENTS])
+            for relic_name, relic in relic_data_map.items()
+            for rarity in RARITIES for item_name in relic.get(rarity, [])
+        ])
+
+    def rows(self) -> Iterator[tuple[str, str, str, list[float]]]:
+        for relic, item, rarity, chance in zip(self.relic, self.item, self.rarity, self.chance.tolist()):
+            yield self.relic_names[relic], self.item_names[item], RARITIES[rarity], chance
+
+    def select(self, mask: np.ndarray) -> 'RelicTable':
+        "only keep the rows in mask (bool array), names are re-indexed"
+        return RelicTable.from_rows([row for row, keep in zip(self.rows(), mask) if keep])
+
+    def select_relics(self, relic_names: Iterable[str]) -> 'RelicTable':
+        relic_names = set(relic_names)
+        return self.select(np.array([name in relic_names for name in self.relic_names], dtype=bool)[self.relic])
+
+    def select_relics_with_item(self, substr: str) -> 'RelicTable':
+        "every row of every relic that has an item containing substr (case-insensitive)"
+        matched_item = np.array([substr.lower() in name.lower() for name in self.item_names], dtype=bool)
+        matched_relic = np.zeros(len(self.relic_names), dtype=bool)
+        matched_relic[self.relic[matched_item[self.item]]] = True
+        return self.select(matched_relic[self.relic])
+
+    def discard_items(self, substr: str) -> 'RelicTable':
+        "e.g. discard_items('Forma Blueprint')"
+        keep_item = np.array([substr not in name for name in self.item_names], dtype=bool)
+        return self.select(keep_item[self.item])
+
+    def merge(self, other: 'RelicTable') -> 'RelicTable':
+        "relics in other replaces the ones in self"
+        other_relics = set(other.relic_names)
+        return RelicTable.from_rows(
+            [row for row in self.rows() if row[0] not in other_relics] + list(other.rows())
+        )
+
+    def get_relic_expected_price(self, item_prices: np.ndarray, level: str = 'Radiant') -> np.ndarray:
+        """
+            item_prices: price for each item in item_names
+            return the expected price for each relic in relic_names
+        """
+        weights = self.chance[:, REFINEMENTS.index(level)] * item_prices[self.item]
+        return np.bincount(self.relic, weights=weights, minlength=len(self.relic_names))
+
+    def get_expected_price_table(self, item_prices: np.ndarray) -> np.ndarray:
+        """
+            item_prices: price for each item in item_names
+            return (relics, levels) array, the expected price of each relic in relic_names
+            at each level in REFINEMENTS
+        """
+        table = np.zeros((len(self.relic_names), len(REFINEMENTS)))
+        np.add.at(table, self.relic, self.chance * item_prices[self.item][:, None])
+        return table
+
+    def to_relic_data_map(self) -> dict[str, dict[str, list[str]]]:
+        "{relic name -> {rarity: list of items}}"
+        relic_map = {name: {rarity: [] for rarity in RARITIES} for name in self.relic_names}
+        for relic_name, item_name, rarity, _ in self.rows():
+            relic_map[relic_name][rarity].append(item_name)
+        return relic_map
+
+    def to_json(self) -> dict:
+        return {
+            'relic_names': self.relic_names, 'item_names': self.item_names,
+            'relic': self.relic.tolist(), 'item': self.item.tolist(),
+            'rarity': self.rarity.tolist(), 'chance': self.chance.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, table_json: dict):
+        return cls(
+            table_json['relic_names'], table_json['item_names'],
+            np.array(table_json['relic'], dtype=np.int32), np.array(table_json['item'], dtype=np.int32),
+            np.array(table_json['rarity'], dtype=np.int8),
+            np.array(table_json['chance'], dtype=float).reshape(-1, len(REFINEMENTS)),
+        )
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator:
+    """
+        yield every element of the array `key` in a json document like {key: [...]},
+        without having the whole document in memory
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+
+    def read_more():
+        nonlocal buf
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError(f'unexpected end of json while reading "{key}"')
+        buf += utf8.decode(chunk)
+
+    # find the start of the array
+    while True:
+        start = buf.find(f'"{key}"')
+        if start >= 0 and '[' in buf[start:]:
+            pos = buf.index('[', start) + 1
+            break
+        read_more()
+
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            read_more()
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            read_more()
+            continue
+        yield element
+        buf, pos = buf[end:], 0
+
+def parse_relic_json(relic_ls: Iterable[dict]) -> RelicTable:
+    """
+        relic_ls: the elements of relics.json['relics'], like {
+            "tier": "Axi", "relicName": "A1", "state": "Intact",
+            "rewards": [{"itemName": "...", "rarity": "Uncommon", "chance": 11}, ...]
+        }
+
+        rows are the rewards of the Intact relic, the other states only fill in the chances
+    """
+    rows = {}       # (relic name, item name) -> [relic name, item name, rarity, chances]
+    chances = {}    # (relic name, item name) -> {state: chance}
+    for relic_json in relic_ls:
+        relic_name = f"{relic_json['tier']} {relic_json['relicName']}"
+        for reward in relic_json['rewards']:
+            key = (relic_name, reward['itemName'])
+            chances.setdefault(key, {})[relic_json['state']] = reward['chance'] / 100
+
+            if relic_json['state'] == 'Intact':
+                # filter by chance: [25.33, 11, 2] if there is no rarity, use 20, 5 as a bound
+                rarity = reward.get('rarity')
+                if rarity not in RARITIES:
+                    rarity = 'Common' if reward['chance'] > 20 else 'Uncommon' if reward['chance'] > 5 else 'Rare'
+                rows[key] = [relic_name, reward['itemName'], rarity, None]
+
+    for key, row in rows.items():
+        row[3] = [chances[key].get(level, RARITY_CHANCES[level][row[2]]) for level in REFINEMENTS]
+    return RelicTable.from_rows(list(rows.values()))
+
+def fetch_relic_table() -> RelicTable:
+    "stream relics.json and parse it"
+    import requests
+
+    with requests.get(RELIC_URL, stream=True) as r:
+        r.raise_for_status()
+        return parse_relic_json(iter_json_array(r.iter_content(chunk_size=1 << 16), 'relics'))
+
+def get_drop_data_hash() -> str | None:
+    "the hash of the current drop data, None if can't tell"
+    import requests
+    try:
+        r = requests.get(INFO_URL, timeout=10)
+        return r.json().get('hash')
+    except (requests.RequestException, ValueError):
+        return None
+
+_relic_table: RelicTable | None = None
+
+def _write_relic_cache(cache_path: str, cache: dict):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + '.tmp', 'w') as f:
+        json.dump(cache, f)
+    os.replace(cache_path + '.tmp', cache_path)
+
+def get_relic_table(cache_path: str = RELIC_CACHE_PATH, refresh: bool = False,
+                    ttl: float = RELIC_CACHE_TTL) -> RelicTable:
+    """
+        the relic table from drops.warframestat.us, kept in memory after the first call.
+        loaded from cache_path as is if it was checked in the last {ttl} seconds,
+        otherwise only if the drop data hasn't changed since (or info.json can't be reached).
+        refresh: always download again
+    """
+    global _relic_table
+    if _relic_table is not None and not refresh:
+        return _relic_table
+
+    cache = None
+    if not refresh and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = None    # broken cache, just download again
+
+    if cache is not None and time.time() - cache.get('checked_at', 0) < ttl:
+        _relic_table = RelicTable.from_json(cache['table'])
+        return _relic_table
+
+    drop_data_hash = get_drop_data_hash()
+    # can't reach info.json, the cache is better than nothing
+    if cache is not None and (drop_data_hash is None or cache['drop_data_hash'] == drop_data_hash):
+        cache['checked_at'] = time.time()
+        _write_relic_cache(cache_path, cache)
+        _relic_table = RelicTable.from_json(cache['table'])
+        return _relic_table
+
+    table = fetch_relic_table()
+    _write_relic_cache(cache_path, {'drop_data_hash': drop_data_hash, 'checked_at': time.time(),
+                                    'table': table.to_json()})
+    _relic_table = table
+    return _relic_table
+
+def get_all_relic_table(discard_forma: bool = True) -> RelicTable:
+    """
+        drops.warframestat.us merged with the manually recorded data.relic_data.relic_data_map,
+        drops.warframestat.us wins if both have the relic
+    """
+    from data.relic_data import relic_data_map
+    table = RelicTable.from_relic_data_map(relic_data_map).merge(get_relic_table())
+    if discard_forma:
+        table = table.discard_items('Forma Blueprint')
+    return table
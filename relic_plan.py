@@ -0,0 +1,197 @@
+"""
+    what to do with the relics you own: sell them, open them as is, or refine them first
+
+    every relic can be sold (relics are market items too, "<relic name> Relic") or opened
+    at one of the REFINEMENTS, which costs void traces. with a limited traces budget this is
+    a multiple-choice knapsack: every owned relic picks one option, refining costs traces and
+    gains (expected plat at that level - the best of selling / opening it intact).
+    it is solved exactly by DP over the budget (in units of the gcd of the costs), using the
+    (relics, levels) expected plat table from relic.RelicTable. copies of the same relic are
+    bundled (see split_copies), so the DP grows with log(count) instead of count.
+
+    selling is priced with the intact trades / orders of the relic only (the market keeps refinement
+    as a subtype), entries without a subtype count too.
+
+    the inventory file is json, {relic name: count}, e.g. {"Lith E1": 3, "Axi R4": 1}
+
+    ```
+    python relic_plan.py inventory.json --traces 800
+    ```
+"""
+from dataclasses import dataclass, field
+import argparse
+import json
+import math
+
+import numpy as np
+
+import relic
+
+REFINEMENT_COSTS = {'Intact': 0, 'Exceptional': 25, 'Flawless': 50, 'Radiant': 100}
+
+@dataclass
+class RelicPlan:
+    """
+        one entry per relic, in the same order as relic_names
+        open_count[:, i] is how many to open at level REFINEMENTS[i]
+    """
+    relic_names: list[str]
+    sell_count: np.ndarray
+    open_count: np.ndarray
+    expected_plat: np.ndarray   # total of every copy of that relic
+    traces_used: int
+    ignored: list[str] = field(default_factory=list)   # inventory relics without drop data
+
+    @property
+    def total_plat(self):
+        return float(self.expected_plat.sum())
+
+def load_inventory(path: str) -> dict[str, int]:
+    with open(path) as f:
+        return {relic_name: int(count) for relic_name, count in json.load(f).items() if int(count) > 0}
+
+def split_copies(count: int, n_levels: int) -> list[int]:
+    """
+        split count copies into bundles, n_levels of each power of two (1, 1, 1, 2, 2, 2, 4, ...)
+        and the rest in the last ones. any way to give up to count copies to n_levels levels
+        can be made of whole bundles, so the DP only needs O(n_levels * log(count)) steps
+    """
+    sizes, size = [], 1
+    while count > 0:
+        for _ in range(n_levels):
+            if count == 0:
+                break
+            sizes.append(min(size, count))
+            count -= sizes[-1]
+        size *= 2
+    return sizes
+
+def plan_relics(relic_names: list[str], counts: np.ndarray, ev_table: np.ndarray, sell_price: np.ndarray,
+                traces: int, refinement_costs: dict[str, int] = REFINEMENT_COSTS) -> RelicPlan:
+    """
+        counts: how many of each relic are owned
+        ev_table: (relics, levels) expected plat when opened at each level in REFINEMENTS
+        sell_price: plat if the relic is sold, 0 if it can't be sold
+        traces: void traces budget
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    costs = np.array([refinement_costs[level] for level in relic.REFINEMENTS], dtype=np.int64)
+    n_relics, n_levels = ev_table.shape
+
+    # without traces: sell it or open it at the best free level (intact), whichever is worth more
+    free = costs == 0
+    free_level = np.where(free, ev_table, -np.inf).argmax(axis=1)
+    free_ev = ev_table[np.arange(n_relics), free_level]
+    sell = sell_price > free_ev
+    base = np.where(sell, sell_price, free_ev)
+    gain = np.where(free, -np.inf, ev_table - base[:, None])
+    gain[:, costs > traces] = -np.inf
+
+    # budget in units of the gcd of the costs, so the DP is small
+    unit = math.gcd(*costs[costs > 0].tolist()) or 1
+    cost_units = costs // unit
+    budget = traces // unit
+
+    # copies worth refining, but never more than the budget can refine
+    worth = gain > 0
+    min_cost = np.where(worth, cost_units, np.iinfo(np.int64).max).min(axis=1)
+    n_refinable = np.where(worth.any(axis=1), np.minimum(counts, budget // np.maximum(min_cost, 1)), 0)
+
+    # identical copies go in bundles that are refined together, one DP step per bundle
+    bundle_relic, bundle_size = [], []
+    for r in np.flatnonzero(n_refinable):
+        sizes = split_copies(int(n_refinable[r]), int(worth[r].sum()))
+        bundle_relic += [r] * len(sizes)
+        bundle_size += sizes
+
+    # value[b] = best total gain using at most b units of traces, padded[budget + 1 + b] = value[b]
+    padded = np.concatenate([np.full(budget + 1, -np.inf), np.zeros(budget + 1)])
+    value = padded[budget + 1:]
+    value_index = np.arange(budget + 1, 2 * (budget + 1))
+    level_index = np.arange(n_levels, dtype=np.int8)[:, None]
+    choice = np.zeros((len(bundle_size), budget + 1), dtype=np.int8)
+    for u, (r, size) in enumerate(zip(bundle_relic, bundle_size)):
+        # candidates[level, b]: the bundle opened at that level (level 0: left as is), -inf if b is too small
+        bundle_gain = np.where(worth[r], size * gain[r], -np.inf)
+        bundle_gain[0] = 0
+        shift = np.minimum(size * cost_units, budget + 1)
+        shift[0] = 0
+        candidates = padded[value_index - shift[:, None]] + bundle_gain[:, None]
+        value[:] = candidates.max(axis=0)
+        choice[u] = ((candidates == value) * level_index).max(axis=0)
+
+    # walk back to see which level every bundle got
+    refined = np.zeros((n_relics, n_levels), dtype=np.int64)
+    b = budget
+    for u in range(len(bundle_size) - 1, -1, -1):
+        level = choice[u, b]
+        if level > 0:
+            refined[bundle_relic[u], level] += bundle_size[u]
+            b -= bundle_size[u] * cost_units[level]
+
+    n_base = counts - refined.sum(axis=1)
+    open_count = refined.copy()
+    open_count[np.arange(n_relics), free_level] += np.where(sell, 0, n_base)
+    sell_count = np.where(sell, n_base, 0)
+    expected_plat = sell_count * sell_price + (open_count * ev_table).sum(axis=1)
+    return RelicPlan(relic_names, sell_count, open_count, expected_plat, int((refined * costs).sum()))
+
+def plan_inventory(inventory: dict[str, int], traces: int, refinement_costs: dict[str, int] = REFINEMENT_COSTS,
+                   market_map: dict | None = None, priority: str = 'interactive') -> RelicPlan:
+    """
+        inventory: {relic name -> count}, relics without drop data are ignored
+        items / relics that are not on the market count as 0 plat
+    """
+    import warframe_market as wfm
+    import oracle
+
+    market_map = market_map if market_map is not None else wfm.get_market_items_name_map()
+    relic_table = relic.get_all_relic_table(discard_forma=True).select_relics(inventory)
+
+    item_names = relic_table.item_names + [f'{relic_name} Relic' for relic_name in relic_table.relic_names]
+    on_market = np.array([name in market_map for name in item_names], dtype=bool)
+    market_items = [market_map[name] for name in item_names if name in market_map]
+    wfm.prepare_market_items(market_items, priority=priority, job='relic plan')
+    prices = np.zeros(len(item_names))
+    n_items = len(relic_table.item_names)
+    n_items_on_market = int(on_market[:n_items].sum())
+    prices[:n_items][on_market[:n_items]] = oracle.get_oracle_prices(market_items[:n_items_on_market])
+    prices[n_items:][on_market[n_items:]] = oracle.get_oracle_prices(market_items[n_items_on_market:], subtype='intact')
+
+    plan = plan_relics(
+        relic_table.relic_names, np.array([inventory[name] for name in relic_table.relic_names]),
+        relic_table.get_expected_price_table(prices[:n_items]), prices[n_items:], traces, refinement_costs
+    )
+    plan.ignored = [name for name in inventory if name not in relic_table.relic_names]
+    return plan
+
+def print_relic_plan(plan: RelicPlan):
+    from tabulate import tabulate
+    rows = [
+        [relic_name, plan.sell_count[i], *plan.open_count[i], f'{plan.expected_plat[i]:.2f}']
+        for i, relic_name in sorted(enumerate(plan.relic_names), key=lambda a: -plan.expected_plat[a[0]])
+    ]
+    print(tabulate(
+        rows, headers=['Relic', 'Sell', *[f'Open {level}' for level in relic.REFINEMENTS], 'Plat'],
+        tablefmt='rounded_outline', colalign=('left',) + ('right',) * (len(relic.REFINEMENTS) + 2)
+    ))
+    print(f'Total: {plan.total_plat:.2f} plat, {plan.traces_used} void traces used')
+    if plan.ignored:
+        print(f'Ignored (no drop data): {", ".join(plan.ignored)}')
+
+def main():
+    parser = argparse.ArgumentParser(description='plan which relics to sell / open / refine')
+    parser.add_argument('inventory', help='json file, {relic name: count}')
+    parser.add_argument('--traces', type=int, default=0, help='void traces budget')
+    for level in relic.REFINEMENTS[1:]:
+        parser.add_argument(f'--{level.lower()}-cost', type=int, default=REFINEMENT_COSTS[level],
+                            help=f'void traces to refine to {level}')
+    args = parser.parse_args()
+
+    refinement_costs = {'Intact': 0} | {
+        level: getattr(args, f'{level.lower()}_cost') for level in relic.REFINEMENTS[1:]
+    }
+    print_relic_plan(plan_inventory(load_inventory(args.inventory), args.traces, refinement_costs))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+    full market scan, sharded over several worker processes / boxes
+
+    one process under one IP's rate limit takes forever to prepare() every item,
+    so the coordinator splits the catalog into shards (by item id hash) and puts them
+    in a lease-based work queue (a SQLite file, put it on a shared filesystem if the
+    workers are on other boxes). each worker claims a shard, prepare()-s its items the
+    normal way, writes a partial snapshot and marks the shard done. a worker that dies
+    stops renewing its lease, so the shard goes back to the queue once the lease expires,
+    up to MAX_ATTEMPTS times, after that the shard is marked failed.
+    items the API won't give (fetch.FetchError, e.g. 404 or too many 429s) are left out of the
+    shard and listed in its `missing`. when every shard is done (or failed) the coordinator
+    merges the partial snapshots into one, and reports what is missing.
+
+    ```
+    python scan.py coordinate --db scan.db --out-dir scan --shards 64    # prints the scan id
+    python scan.py work --db scan.db --out-dir scan                      # on every worker
+    ```
+
+    use WFM_API_BASE (see warframe_market.py) to run everything against a stand-in API server,
+    e.g. fake_api.py. check_scan.py does that with several local workers, killing one on the way.
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import warframe_market as wfm
+import snapshot
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    n_shards INTEGER NOT NULL,
+    catalog TEXT NOT NULL,          -- json list of the v2 item json, so every worker has the same items
+    merged_path TEXT
+);
+CREATE TABLE IF NOT EXISTS shards (
+    scan_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    status TEXT NOT NULL,           -- pending, leased, done, failed
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    missing TEXT,                   -- json list of the item ids that couldn't be fetched
+    PRIMARY KEY (scan_id, shard)
+);
+"""
+
+# a shard whose lease expired this many times (the worker died every time) is failed
+MAX_ATTEMPTS = 3
+
+def get_shard(item_id: str, n_shards: int) -> int:
+    "stable across processes and boxes, unlike hash()"
+    return int(hashlib.sha1(item_id.encode()).hexdigest()[:8], 16) % n_shards
+
+class WorkQueue:
+    """
+        lease-based shard queue in a SQLite file.
+        every method opens its own connection, so one instance can be used from several threads
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            if 'missing' not in [row['name'] for row in conn.execute('PRAGMA table_info(shards)')]:
+                conn.execute('ALTER TABLE shards ADD COLUMN missing TEXT')   # db from before it was added
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def create_scan(self, catalog: list[dict], n_shards: int) -> str:
+        scan_id = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO scans (scan_id, created_at, n_shards, catalog) VALUES (?, ?, ?, ?)', (
+                scan_id, datetime.datetime.now(datetime.timezone.utc).isoformat(), n_shards, json.dumps(catalog)
+            ))
+            conn.executemany('INSERT INTO shards (scan_id, shard, status) VALUES (?, ?, ?)', [
+                (scan_id, shard, 'pending') for shard in range(n_shards)
+            ])
+            conn.execute('COMMIT')
+        return scan_id
+
+    def get_scan(self, scan_id: str) -> sqlite3.Row:
+        with self._connect() as conn:
+            return conn.execute('SELECT * FROM scans WHERE scan_id = ?', (scan_id,)).fetchone()
+
+    def get_unfinished_scan_ids(self) -> list[str]:
+        with self._connect() as conn:
+            return [row['scan_id'] for row in conn.execute(
+                'SELECT DISTINCT scan_id FROM shards WHERE status NOT IN (?, ?) ORDER BY scan_id', ('done', 'failed')
+            )]
+
+    def claim(self, worker: str, lease: float, max_attempts: int = MAX_ATTEMPTS) -> tuple[str, int] | None:
+        """
+            claim a pending shard, or a leased one whose lease has expired (i.e. the worker died)
+            expired ones that were already tried max_attempts times are marked failed instead
+            return (scan_id, shard), None if there is nothing to do right now
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'UPDATE shards SET status = ?, lease_until = NULL WHERE status = ? AND lease_until < ? AND attempts >= ?',
+                ('failed', 'leased', now, max_attempts)
+            )
+            row = conn.execute(
+                'SELECT scan_id, shard FROM shards '
+                'WHERE status = ? OR (status = ? AND lease_until < ?) '
+                'ORDER BY scan_id, attempts, shard LIMIT 1',
+                ('pending', 'leased', now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE shards SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 '
+                'WHERE scan_id = ? AND shard = ?',
+                ('leased', worker, now + lease, row['scan_id'], row['shard'])
+            )
+            conn.execute('COMMIT')
+        return row['scan_id'], row['shard']
+
+    def renew(self, scan_id: str, shard: int, worker: str, lease: float) -> bool:
+        "False if the lease is lost, i.e. it expired and someone else took the shard"
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE shards SET lease_until = ? WHERE scan_id = ? AND shard = ? AND worker = ? AND status = ?',
+                (time.time() + lease, scan_id, shard, worker, 'leased')
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, scan_id: str, shard: int, worker: str, output_path: str, missing: list[str] | None = None) -> bool:
+        """
+            missing: ids of the items that couldn't be fetched
+            False if the lease is lost, the result should be thrown away then
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE shards SET status = ?, output_path = ?, missing = ?, lease_until = NULL '
+                'WHERE scan_id = ? AND shard = ? AND worker = ? AND status = ?',
+                ('done', output_path, json.dumps(missing or []), scan_id, shard, worker, 'leased')
+            )
+            return cursor.rowcount == 1
+
+    def get_shards(self, scan_id: str) -> list[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute('SELECT * FROM shards WHERE scan_id = ? ORDER BY shard', (scan_id,)).fetchall()
+
+    def set_merged(self, scan_id: str, merged_path: str):
+        with self._connect() as conn:
+            conn.execute('UPDATE scans SET merged_path = ? WHERE scan_id = ?', (merged_path, scan_id))
+
+"""
+    Worker
+"""
+
+def get_shard_items(catalog: list[dict], n_shards: int, shard: int) -> list[wfm.MarketItem]:
+    return [
+        wfm.MarketItem(item_json, api_version='v2') for item_json in catalog
+        if get_shard(item_json['id'], n_shards) == shard
+    ]
+
+class LeaseKeeper:
+    """
+        renews the lease every lease / 3 seconds in a thread while the shard is being worked on
+        `lost` is set if renewing ever fails
+    """
+    def __init__(self, queue: WorkQueue, scan_id: str, shard: int, worker: str, lease: float):
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+
+        def loop():
+            while not self._stop.wait(lease / 3):
+                if not queue.renew(scan_id, shard, worker, lease):
+                    self.lost.set()
+                    return
+        self._thread = threading.Thread(target=loop, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+def run_worker(db_path: str, out_dir: str, worker: str | None = None, lease: float = 120,
+               idle_wait: float = 5, exit_when_idle: bool = True):
+    """
+        claim shards until there is nothing left
+        exit_when_idle: False to keep waiting for new scans forever
+    """
+    worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+    queue = WorkQueue(db_path)
+    catalogs = {}   # scan_id -> (catalog, n_shards)
+
+    while True:
+        claimed = queue.claim(worker, lease)
+        if claimed is None:
+            # some shards may still be leased by others, they come back if those workers die
+            if exit_when_idle and not queue.get_unfinished_scan_ids():
+                return
+            time.sleep(idle_wait)
+            continue
+
+        scan_id, shard = claimed
+        if scan_id not in catalogs:
+            scan = queue.get_scan(scan_id)
+            catalogs[scan_id] = (json.loads(scan['catalog']), scan['n_shards'])
+        catalog, n_shards = catalogs[scan_id]
+
+        with LeaseKeeper(queue, scan_id, shard, worker, lease) as keeper:
+            market_items = get_shard_items(catalog, n_shards, shard)
+            failed = []
+            wfm.prepare_market_items(market_items, priority='background', job=f'scan {scan_id}', failed=failed)
+
+        if keeper.lost.is_set():
+            continue    # someone else has it now
+        missing = {item.id for item, _ in failed}
+        output_path = os.path.join(out_dir, scan_id, f'shard-{shard:04d}.snap')
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        snapshot.write_snapshot(output_path + f'.{worker}.tmp', [item for item in market_items if item.id not in missing])
+        os.replace(output_path + f'.{worker}.tmp', output_path)
+        queue.complete(scan_id, shard, worker, output_path, [item.id for item, _ in failed])
+
+"""
+    Coordinator
+"""
+
+def start_scan(db_path: str, n_shards: int = 64) -> str:
+    catalog = json.loads(wfm.retry_request(f'{wfm.API_BASE}/v2/items', headers={
+        'accept': 'application/json',
+        'Language': 'en',
+        'User-agent': wfm.USER_AGENT
+    }).content)['data']
+    return WorkQueue(db_path).create_scan(catalog, n_shards)
+
+def wait_scan(db_path: str, scan_id: str, poll: float = 5, verbose: bool = True):
+    queue = WorkQueue(db_path)
+    while True:
+        shards = queue.get_shards(scan_id)
+        n_done = sum(shard['status'] == 'done' for shard in shards)
+        n_failed = sum(shard['status'] == 'failed' for shard in shards)
+        if verbose:
+            n_leased = sum(shard['status'] == 'leased' for shard in shards)
+            print(f'{scan_id}: {n_done} done, {n_failed} failed, {n_leased} leased, '
+                  f'{len(shards) - n_done - n_failed - n_leased} pending')
+        if n_done + n_failed == len(shards):
+            return
+        time.sleep(poll)
+
+def merge_scan(db_path: str, scan_id: str, out_dir: str, verbose: bool = True) -> str:
+    """
+        merge every shard's snapshot into {out_dir}/{scan_id}.snap, items in catalog order.
+        the snapshot is timestamped with when the scan started.
+        items of failed shards and items that couldn't be fetched are left out (printed if verbose)
+    """
+    queue = WorkQueue(db_path)
+    scan = queue.get_scan(scan_id)
+    shards = queue.get_shards(scan_id)
+    if any(shard['status'] not in ['done', 'failed'] for shard in shards):
+        raise RuntimeError(f'scan {scan_id} is not done yet')
+
+    items = {}
+    for shard in shards:
+        if shard['status'] == 'done':
+            for item in snapshot.load_snapshot(shard['output_path']).get_market_items():
+                items[item.id] = item
+    catalog = json.loads(scan['catalog'])
+    if verbose:
+        failed_shards = [shard['shard'] for shard in shards if shard['status'] == 'failed']
+        missing = [item_json['urlName'] for item_json in catalog if item_json['id'] not in items]
+        if failed_shards:
+            print(f'{scan_id}: {len(failed_shards)} shard(s) failed after {MAX_ATTEMPTS} attempts: {failed_shards}')
+        if missing:
+            print(f'{scan_id}: {len(missing)} item(s) missing, e.g. {missing[:5]}')
+
+    merged_path = os.path.join(out_dir, f'{scan_id}.snap')
+    snapshot.write_snapshot(
+        merged_path + '.tmp',
+        [items[item_json['id']] for item_json in catalog if item_json['id'] in items],
+        created_at=datetime.datetime.fromisoformat(scan['created_at'])
+    )
+    os.replace(merged_path + '.tmp', merged_path)
+    queue.set_merged(scan_id, merged_path)
+    return merged_path
+
+def main():
+    parser = argparse.ArgumentParser(description='sharded full market scan')
+    parser.add_argument('command', choices=['coordinate', 'work', 'merge'])
+    parser.add_argument('--db', default='scan.db')
+    parser.add_argument('--out-dir', default='scan')
+    parser.add_argument('--shards', type=int, default=64)
+    parser.add_argument('--scan-id', help='for merge')
+    parser.add_argument('--lease', type=float, default=120, help='seconds before a silent worker loses its shard')
+    args = parser.parse_args()
+
+    if args.command == 'coordinate':
+        scan_id = start_scan(args.db, args.shards)
+        print(f'scan id: {scan_id}')
+        wait_scan(args.db, scan_id)
+        print(merge_scan(args.db, scan_id, args.out_dir))
+    elif args.command == 'work':
+        run_worker(args.db, args.out_dir, lease=args.lease)
+    elif args.command == 'merge':
+        print(merge_scan(args.db, args.scan_id, args.out_dir))
+
+if __name__ == '__main__':
+    main()
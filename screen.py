@@ -0,0 +1,343 @@
+"""
+    screen the whole market over the 90days (daily) statistic
+
+    every item's closed 90days statistic goes into one item x day table per column
+    (median, volume, ...), then a small expression is evaluated on the whole table at once:
+
+    ```
+    python screen.py market.snap --where "pct_change(ma(median, 7), 7) > 0.2 and mean(volume, 7) > 50"
+    python screen.py market.snap --where "last(median) > 30" --sort "std(median, 90) / mean(median, 90)" --asc
+    ```
+
+    expressions are python syntax (numbers, + - * /, comparisons, and / or / not) over:
+        - columns: every stat column, e.g. median, volume, avg_price, min_price, max_price, moving_avg
+          an item x day table, NaN (volume 0) on days without data
+        - rolling, one value per day:   ma(x, n), mstd(x, n), msum(x, n)
+        - aggregate, one value per item: mean(x, n), std(x, n), sum(x, n), min(x, n), max(x, n), count(x, n)
+                                         over the last n days (all days if n is not given),
+                                         last(x): last value that is not NaN,
+                                         pct_change(x, n): last day vs n days before that
+        - abs(x)
+    x of every function except abs has to be per day values, n a whole number of days
+    (1 to the table's days, minus one for pct_change).
+    mixing per day and per item values works like numpy broadcasting,
+    and a per day result is taken at the last day when filtering / sorting
+"""
+import argparse
+import ast
+import datetime
+
+import numpy as np
+
+import warframe_market as wfm
+
+DAY = 24 * 60 * 60
+COLUMNS = [
+    'volume', 'min_price', 'max_price', 'open_price', 'closed_price',
+    'avg_price', 'wa_price', 'median', 'moving_avg', 'donch_top', 'donch_bot',
+]
+
+class DailyTable:
+    """
+        item x day table, one 2d array per stat column. day -1 is the newest day
+    """
+    def __init__(self, items: list[wfm.MarketItem], start: datetime.datetime, columns: dict[str, np.ndarray]):
+        self.items = items
+        self.start = start
+        self.columns = columns
+
+    @property
+    def n_items(self):
+        return len(self.items)
+
+    @property
+    def n_days(self):
+        return next(iter(self.columns.values())).shape[1]
+
+    @classmethod
+    def from_rows(cls, items: list[wfm.MarketItem], item_idx: np.ndarray, timestamp: np.ndarray,
+                  columns: dict[str, np.ndarray], days: int = 90):
+        """
+            one row per (item, day) stat, e.g. straight out of a snapshot
+            the table ends at the newest day in the rows
+        """
+        end_day = int(timestamp.max()) // DAY if len(timestamp) else 0
+        day_idx = timestamp // DAY - (end_day - days + 1)
+        keep = (day_idx >= 0) & (day_idx < days)
+        item_idx, day_idx = item_idx[keep], day_idx[keep]
+
+        table_columns = {}
+        for column, values in columns.items():
+            table = np.zeros((len(items), days)) if column == 'volume' else np.full((len(items), days), np.nan)
+            table[item_idx, day_idx] = values[keep]
+            table_columns[column] = table
+        start = datetime.datetime.fromtimestamp((end_day - days + 1) * DAY, datetime.timezone.utc)
+        return cls(items, start, table_columns)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, days: int = 90, mod_rank: int = 0):
+        """
+            snapshot: snapshot.Snapshot, the table is made from its arrays directly,
+                      nothing is parsed per item
+        """
+        arrays = snapshot._arrays
+        counts = np.diff(arrays['closed_90days_offsets'].astype(np.int64))
+        item_idx = np.repeat(np.arange(snapshot.n_items), counts)
+        keep = arrays['closed_90days_mod_rank'] == mod_rank
+        return cls.from_rows(
+            snapshot.get_market_items(), item_idx[keep], arrays['closed_90days_datetime'][keep],
+            {column: arrays[f'closed_90days_{column}'][keep] for column in COLUMNS}, days
+        )
+
+    @classmethod
+    def from_market_items(cls, market_items: list[wfm.MarketItem], days: int = 90, mod_rank: int = 0):
+        "market_items must be prepare()-ed"
+        stats = [
+            (i, stat) for i, item in enumerate(market_items)
+            for stat in item.statistic.statistics['statistics_closed']['90days']
+            if stat['mod_rank'] == mod_rank
+        ]
+        return cls.from_rows(
+            market_items, np.array([i for i, _ in stats], dtype=np.int64),
+            np.array([int(stat['datetime'].timestamp()) for _, stat in stats], dtype=np.int64),
+            {column: np.array([stat.get(column, np.nan) for _, stat in stats], dtype=float) for column in COLUMNS},
+            days
+        )
+
+"""
+    Expression functions
+    per day values are (n_items, n_days), per item values are (n_items, 1)
+"""
+
+def _sums(x: np.ndarray, axis: int = 1):
+    "(count, sum, sum of squares) along axis, NaN skipped"
+    valid = np.isfinite(x)
+    x = np.where(valid, x, 0)
+    return valid.sum(axis=axis), x.sum(axis=axis), (x * x).sum(axis=axis)
+
+def _rolling_sums(x: np.ndarray, n: int):
+    "_sums of the last n days, at every day"
+    cumsums = [np.cumsum(np.pad(a, ((0, 0), (1, 0))), axis=1) for a in _sums(x[:, :, None], axis=2)]
+    start = np.maximum(np.arange(x.shape[1]) - n + 1, 0)
+    return tuple(cumsum[:, 1:] - cumsum[:, start] for cumsum in cumsums)
+
+def _divide(a: np.ndarray, b: np.ndarray):
+    "NaN where b is 0"
+    return np.divide(a, b, out=np.full(np.broadcast(a, b).shape, np.nan), where=np.asarray(b) != 0)
+
+def _mean(count: np.ndarray, total: np.ndarray, squares: np.ndarray):
+    return _divide(total, count)
+
+def _std(count: np.ndarray, total: np.ndarray, squares: np.ndarray):
+    mean = _divide(total, count)
+    return np.sqrt(np.maximum(_divide(squares, count) - mean * mean, 0))
+
+def _aggregate(func):
+    "func: (n_items, days) -> (n_items,), only given the last n days"
+    def aggregate(x: np.ndarray, n: int | None = None):
+        return func(x if n is None else x[:, -int(n):])[:, None]
+    return aggregate
+
+def _masked_reduce(func, fill: float):
+    def reduce(x: np.ndarray):
+        valid = np.isfinite(x)
+        return np.where(valid.any(axis=1), func(np.where(valid, x, fill), axis=1), np.nan)
+    return reduce
+
+def _last(x: np.ndarray):
+    valid = np.isfinite(x)
+    last_idx = x.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return np.where(valid.any(axis=1), x[np.arange(len(x)), last_idx], np.nan)[:, None]
+
+def _pct_change(x: np.ndarray, n: int):
+    return _divide(x[:, -1] - x[:, -1 - int(n)], x[:, -1 - int(n)])[:, None]
+
+FUNCTIONS = {
+    'ma': lambda x, n: _mean(*_rolling_sums(x, int(n))),
+    'msum': lambda x, n: _rolling_sums(x, int(n))[1],
+    'mstd': lambda x, n: _std(*_rolling_sums(x, int(n))),
+    'mean': _aggregate(lambda x: _mean(*_sums(x))),
+    'sum': _aggregate(lambda x: _sums(x)[1]),
+    'std': _aggregate(lambda x: _std(*_sums(x))),
+    'count': _aggregate(lambda x: _sums(x)[0].astype(float)),
+    'min': _aggregate(_masked_reduce(np.min, np.inf)),
+    'max': _aggregate(_masked_reduce(np.max, -np.inf)),
+    'last': _last,
+    'pct_change': _pct_change,
+    'abs': np.abs,
+}
+
+# function -> (argument kinds, what it gives)
+#   'daily': per day values, 'days': a whole number of days in [1, n_days],
+#   'lag': a whole number of days in [1, n_days - 1], 'value': anything. '?' for optional
+# gives 'daily', 'item' (one value per item), or 'same' as its argument
+SIGNATURES = {
+    'ma': (['daily', 'days'], 'daily'),
+    'msum': (['daily', 'days'], 'daily'),
+    'mstd': (['daily', 'days'], 'daily'),
+    'mean': (['daily', 'days?'], 'item'),
+    'sum': (['daily', 'days?'], 'item'),
+    'std': (['daily', 'days?'], 'item'),
+    'count': (['daily', 'days?'], 'item'),
+    'min': (['daily', 'days?'], 'item'),
+    'max': (['daily', 'days?'], 'item'),
+    'last': (['daily'], 'item'),
+    'pct_change': (['daily', 'lag'], 'item'),
+    'abs': (['value'], 'same'),
+}
+KINDS = ['number', 'item', 'daily']   # mixing them gives the last one
+
+BINARY_OPERATORS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: _divide,
+}
+COMPARE_OPERATORS = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+
+class Expression:
+    """
+        parsed once, can then be evaluated on any DailyTable.
+        raises ValueError on anything that is not in the expression language,
+        or on wrong function arguments (n that doesn't fit the table is found by evaluate)
+    """
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            self._tree = ast.parse(text, mode='eval').body
+        except SyntaxError as e:
+            raise ValueError(f'cannot parse {text!r}: {e.msg}') from None
+        self._days: list[tuple[str, int, int]] = []     # (function, n, 0 for 'days' or 1 for 'lag')
+        self._check(self._tree)
+
+    def _check(self, node: ast.AST) -> str:
+        "raise ValueError if node is not allowed, return its kind in KINDS"
+        match node:
+            case ast.Constant(value=int() | float()):
+                return 'number'
+            case ast.Name(id=name):
+                if name not in COLUMNS:
+                    raise ValueError(f'unknown column {name!r}, should be one of {COLUMNS}')
+                return 'daily'
+            case ast.Call(func=ast.Name(id=name), args=args, keywords=[]):
+                if name not in FUNCTIONS:
+                    raise ValueError(f'unknown function {name!r}, should be one of {list(FUNCTIONS)}')
+                return self._check_call(name, args)
+            case ast.BinOp(op=op, left=left, right=right) if type(op) in BINARY_OPERATORS:
+                return self._combine([left, right])
+            case ast.UnaryOp(op=ast.USub() | ast.Not(), operand=operand):
+                return self._check(operand)
+            case ast.BoolOp(values=values):
+                return self._combine(values)
+            case ast.Compare(left=left, ops=ops, comparators=comparators) \
+                    if all(type(op) in COMPARE_OPERATORS for op in ops):
+                return self._combine([left, *comparators])
+            case _:
+                raise ValueError(f'not allowed in expression: {ast.unparse(node)!r}')
+
+    def _combine(self, nodes: list[ast.AST]) -> str:
+        return max((self._check(node) for node in nodes), key=KINDS.index)
+
+    def _check_call(self, name: str, args: list[ast.AST]) -> str:
+        kinds, result = SIGNATURES[name]
+        n_required = sum(not kind.endswith('?') for kind in kinds)
+        usage = f"{name}({', '.join('n' if kind.rstrip('?') in ['days', 'lag'] else 'x' for kind in kinds)})"
+        if not n_required <= len(args) <= len(kinds):
+            raise ValueError(f'{usage} takes {n_required}{"" if n_required == len(kinds) else f" to {len(kinds)}"} '
+                             f'argument(s), got {len(args)}')
+
+        arg_kinds = []
+        for kind, arg in zip(kinds, args):
+            kind = kind.rstrip('?')
+            if kind in ['days', 'lag']:
+                if not (isinstance(arg, ast.Constant) and type(arg.value) is int and arg.value >= 1):
+                    raise ValueError(f'n in {usage} should be a whole number of days >= 1, got {ast.unparse(arg)!r}')
+                self._days.append((name, arg.value, kind == 'lag'))
+                continue
+            arg_kind = self._check(arg)
+            if kind == 'daily' and arg_kind != 'daily':
+                raise ValueError(f'x in {usage} should be per day values (a column or ma / msum / mstd), '
+                                 f'got {ast.unparse(arg)!r}')
+            arg_kinds.append(arg_kind)
+        return arg_kinds[0] if result == 'same' else result
+
+    def _eval(self, node: ast.AST, table: DailyTable):
+        match node:
+            case ast.Constant(value=value):
+                return value
+            case ast.Name(id=name):
+                return table.columns[name]
+            case ast.Call(func=ast.Name(id=name), args=args):
+                return FUNCTIONS[name](*[self._eval(arg, table) for arg in args])
+            case ast.BinOp(op=op, left=left, right=right):
+                return BINARY_OPERATORS[type(op)](self._eval(left, table), self._eval(right, table))
+            case ast.UnaryOp(op=ast.USub(), operand=operand):
+                return -self._eval(operand, table)
+            case ast.UnaryOp(op=ast.Not(), operand=operand):
+                return ~np.asarray(self._eval(operand, table), dtype=bool)
+            case ast.BoolOp(op=op, values=values):
+                combine = np.logical_and if isinstance(op, ast.And) else np.logical_or
+                result = np.asarray(self._eval(values[0], table), dtype=bool)
+                for value in values[1:]:
+                    result = combine(result, np.asarray(self._eval(value, table), dtype=bool))
+                return result
+            case ast.Compare(left=left, ops=ops, comparators=comparators):
+                result, left_value = True, self._eval(left, table)
+                for op, comparator in zip(ops, comparators):
+                    right_value = self._eval(comparator, table)
+                    result = np.logical_and(result, COMPARE_OPERATORS[type(op)](left_value, right_value))
+                    left_value = right_value
+                return result
+
+    def evaluate(self, table: DailyTable) -> np.ndarray:
+        "one value per item, per day results are taken at the last day"
+        for name, n, lag in self._days:
+            if n > table.n_days - lag:
+                raise ValueError(f'n in {name}() should be at most {table.n_days - lag} '
+                                 f'for a {table.n_days} day table, got {n}')
+        with np.errstate(invalid='ignore'):
+            result = np.asarray(self._eval(self._tree, table))
+        if result.ndim < 2:
+            return np.broadcast_to(result, (table.n_items,))
+        return np.broadcast_to(result[:, -1], (table.n_items,))
+
+def screen(table: DailyTable, where: str | None = None, sort: str = 'last(median)', ascending: bool = False,
+           show: list[str] = [], limit: int | None = 20) -> list[tuple[wfm.MarketItem, float, list[float]]]:
+    """
+        where: keep the items where it is true, every item if None
+        sort: sort by this, items where it is NaN are dropped
+        show: other expressions to evaluate for the result
+
+        return [(item, sort value, [show values])], sorted
+    """
+    mask = np.ones(table.n_items, dtype=bool) if where is None else Expression(where).evaluate(table).astype(bool)
+    sort_value = Expression(sort).evaluate(table).astype(float)
+    show_values = [Expression(text).evaluate(table).astype(float) for text in show]
+
+    idx = np.flatnonzero(mask & np.isfinite(sort_value))
+    idx = idx[np.argsort(sort_value[idx] if ascending else -sort_value[idx], kind='stable')][:limit]
+    return [(table.items[i], float(sort_value[i]), [float(values[i]) for values in show_values]) for i in idx]
+
+def main():
+    from tabulate import tabulate
+    import snapshot
+
+    parser = argparse.ArgumentParser(description='screen the whole market over the 90days statistic')
+    parser.add_argument('snapshot', help='snapshot file, see snapshot.py')
+    parser.add_argument('--where', default=None)
+    parser.add_argument('--sort', default='last(median)')
+    parser.add_argument('--asc', action='store_true', help='smallest first')
+    parser.add_argument('--show', action='append', default=[], help='more expressions to show, can be repeated')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--mod-rank', type=int, default=0)
+    args = parser.parse_args()
+
+    table = DailyTable.from_snapshot(snapshot.load_snapshot(args.snapshot), mod_rank=args.mod_rank)
+    result = screen(table, args.where, args.sort, args.asc, args.show, args.limit)
+    print(tabulate(
+        [[item.item_name, value, *show_values, item.get_wfm_url()] for item, value, show_values in result],
+        headers=['Name', args.sort, *args.show, 'URL'], tablefmt='rounded_outline', floatfmt='.2f'
+    ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""
+    local price server, so everyone shares one cache instead of each hitting the API
+
+    it owns the fetch layer (one rate limit) and the caches, and serves:
+        - the same paths as warframe market, so any client can just point WFM_API_BASE at it:
+            /v2/items, /v1/items/<url_name>/orders, /v1/items/<url_name>/statistics
+        - /api/item?name=<substring>: item info for every matching item, like Item Info
+        - /api/price/<url_name>?oracle=<oracle name>&mod_rank=<rank>: oracle price
+        - /api/relic?name=<relic name>[,<relic name>...]&level=<refinement>: relic expected plat
+        - /api/syndicate?name=<syndicate>: syndicate items ranked by price and volume
+        - /api/metrics: cache and fetch scheduler stats
+    concurrent identical requests are coalesced into one fetch.
+
+    ```
+    python server.py --port 8642
+    WFM_API_BASE=http://127.0.0.1:8642 WFM_RATE_LIMIT=100 python main.py
+    ```
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+import argparse
+import json
+import threading
+import time
+
+import warframe_market as wfm
+import fetch
+import oracle
+
+class BadRequest(ValueError):
+    "malformed query parameters, 400"
+
+class CoalescingCache:
+    """
+        TTL cache where concurrent get() of the same missing key only fetch once,
+        everyone else waits for that fetch.
+        expired entries are dropped when they are hit, and all of them every ttl seconds,
+        and at most max_size entries are kept (least recently used go first)
+    """
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()   # key -> (expire time, value), least recently used first
+        self._in_flight: dict[object, Future] = {}
+        self._next_sweep = time.monotonic() + ttl
+        self.hits = self.misses = self.coalesced = self.evicted = 0
+
+    def get(self, key, fetch_func):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if is_owner:
+            try:
+                value = fetch_func()
+                with self._lock:
+                    self._put(key, value)
+                future.set_result(value)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+        return future.result()
+
+    def _put(self, key, value):
+        "with the lock held"
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            for expired in [k for k, (expire, _) in self._entries.items() if expire <= now]:
+                del self._entries[expired]
+            self._next_sweep = now + self.ttl
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def get_metrics(self):
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'evicted': self.evicted,
+                'size': len(self._entries)}
+
+class PriceServer:
+    def __init__(self, item_ttl: float = 60, catalog_ttl: float = 3600, max_items: int = 4096, max_results: int = 1024):
+        """
+            max_items: items whose orders / statistics are kept, max_results: api responses kept
+        """
+        self.raw_cache = CoalescingCache(item_ttl, 2 * max_items)   # (kind, url_name) -> raw response bytes
+        self.catalog_cache = CoalescingCache(catalog_ttl)           # kind -> catalog / syndicate items / relic table
+        self.item_cache = CoalescingCache(item_ttl, max_items)      # url_name -> prepare()-ed MarketItem
+        self.result_cache = CoalescingCache(item_ttl, max_results)  # (endpoint, args) -> response body
+        self._executor = ThreadPoolExecutor(16)
+
+    """
+        Raw API, cached as is
+    """
+
+    def get_raw_catalog(self) -> bytes:
+        return self.catalog_cache.get('raw catalog', lambda: wfm.retry_request(f'{wfm.API_BASE}/v2/items', headers={
+            'accept': 'application/json',
+            'Language': 'en',
+            'User-agent': wfm.USER_AGENT
+        }).content)
+
+    def get_raw_item(self, url_name: str, kind: str) -> bytes:
+        """
+            kind in ['orders', 'statistics']
+            KeyError if url_name is not in the catalog, so typos don't cost the shared rate limit
+        """
+        if url_name not in self.get_catalog():
+            raise KeyError(url_name)
+        return self.raw_cache.get((kind, url_name), lambda: wfm.retry_request(
+            f'{wfm.API_BASE}/v1/items/{url_name}/{kind}', headers={
+                'accept': 'application/json',
+                'Platform': 'pc',
+                'User-agent': wfm.USER_AGENT
+            }
+        ).content)
+
+    """
+        Parsed
+    """
+
+    def get_catalog(self) -> dict[str, dict]:
+        "url_name -> v2 item json"
+        def parse():
+            return {item['urlName']: item for item in json.loads(self.get_raw_catalog())['data']}
+        return self.catalog_cache.get('catalog', parse)
+
+    def get_market_map(self) -> dict[str, wfm.MarketItem]:
+        "item name -> MarketItem that is not prepared, like wfm.get_market_items_name_map"
+        def parse():
+            return wfm.get_market_items_name_map([
+                wfm.MarketItem(item_json, api_version='v2') for item_json in self.get_catalog().values()
+            ])
+        return self.catalog_cache.get('market map', parse)
+
+    def get_market_item(self, url_name: str) -> wfm.MarketItem:
+        "a prepared MarketItem, don't change it, it is shared"
+        def prepare():
+            item = wfm.MarketItem(self.get_catalog()[url_name], api_version='v2')
+            item.orders = wfm.Orders(json.loads(self.get_raw_item(url_name, 'orders'))['payload']['orders'])
+            item.statistic = wfm.Statistic(json.loads(self.get_raw_item(url_name, 'statistics'))['payload'])
+            item.price = wfm.PriceOracle(item, item.orders, item.statistic)
+            return item
+        return self.item_cache.get(url_name, prepare)
+
+    def get_market_items(self, url_names: list[str]) -> list[wfm.MarketItem]:
+        return list(self._executor.map(self.get_market_item, url_names))
+
+    """
+        Endpoints
+    """
+
+    def item_info(self, name: str, limit: int = 50):
+        market_map = self.get_market_map()
+        url_names = [item.url_name for item_name, item in market_map.items() if name.lower() in item_name.lower()]
+        items = self.get_market_items(url_names[:limit])
+        prices = oracle.get_oracle_prices(items)
+        result = []
+        for item, price in zip(items, prices):
+            rmax_price = -1
+            if item.is_mod:
+                rmax_price = item.price.get_oracle_price_48hrs(mod_rank_range=[item.mod_max_rank])
+            result.append({
+                'name': item.item_name, 'url_name': item.url_name,
+                'price': float(price), 'rmax_price': rmax_price,
+                'volume_48hr': item.statistic.get_volume_for_last_hours(48),
+                'wfm_url': item.get_wfm_url(),
+            })
+        return {'items': result, 'matched': len(url_names)}
+
+    def price(self, url_name: str, oracle_name: str | None = None, mod_rank: int = 0):
+        if oracle_name is not None and oracle_name not in oracle.oracle_registry:
+            raise KeyError(f'unknown oracle {oracle_name}')
+        item = self.get_market_item(url_name)
+        return {
+            'url_name': url_name, 'oracle': oracle_name, 'mod_rank': mod_rank,
+            'price': item.price.get_oracle_price(oracle_name, mod_rank_range=[mod_rank]),
+        }
+
+    def relic_info(self, relic_names: list[str], level: str = 'Radiant'):
+        import relic
+        if level not in relic.REFINEMENTS:
+            raise BadRequest(f'level should be one of {relic.REFINEMENTS}, got {level!r}')
+        table = self.catalog_cache.get('relic table', lambda: relic.get_all_relic_table(discard_forma=True))
+        table = table.select_relics(relic_names)
+
+        market_map = self.get_market_map()
+        missing = [name for name in table.item_names if name not in market_map]
+        if missing:
+            raise KeyError(f'items not in market: {missing}')
+        items = self.get_market_items([market_map[name].url_name for name in table.item_names])
+        item_prices = oracle.get_oracle_prices(items)
+        expected_plat = table.get_relic_expected_price(item_prices, level)
+
+        level_idx = relic.REFINEMENTS.index(level)
+        relics = {
+            relic_name: {'name': relic_name, 'expected_plat': float(expected_plat[i]), 'rewards': []}
+            for i, relic_name in enumerate(table.relic_names)
+        }
+        for relic_idx, item_idx, rarity, chance in zip(table.relic, table.item, table.rarity, table.chance):
+            relics[table.relic_names[relic_idx]]['rewards'].append({
+                'name': table.item_names[item_idx], 'rarity': relic.RARITIES[rarity],
+                'chance': float(chance[level_idx]), 'price': float(item_prices[item_idx]),
+            })
+        return {'level': level, 'relics': list(relics.values())}
+
+    def syndicate(self, syndicate_name: str):
+        url_names = self.catalog_cache.get(('syndicate', syndicate_name), lambda: [
+            item.url_name for item in wfm.get_syndicate_items(syndicate_name, self.get_market_map())
+        ])
+        items = self.get_market_items(url_names)
+        prices = oracle.get_oracle_prices(items)
+        result = [
+            {'name': item.item_name, 'url_name': item.url_name, 'price': float(price),
+             'volume_48hr': item.statistic.get_volume_for_last_hours(48), 'wfm_url': item.get_wfm_url()}
+            for item, price in zip(items, prices)
+        ]
+        return {
+            'by_price': sorted(result, key=lambda a: a['price'], reverse=True),
+            'by_volume': sorted(result, key=lambda a: a['volume_48hr'], reverse=True),
+        }
+
+    def metrics(self):
+        return {
+            'raw_cache': self.raw_cache.get_metrics(), 'item_cache': self.item_cache.get_metrics(),
+            'result_cache': self.result_cache.get_metrics(),
+            'catalog_cache': self.catalog_cache.get_metrics(), 'scheduler': fetch.get_scheduler().get_metrics(),
+        }
+
+def get_int_param(query: dict[str, str], name: str, default: int) -> int:
+    try:
+        return int(query.get(name, default))
+    except ValueError:
+        raise BadRequest(f'{name} should be an integer, got {query[name]!r}') from None
+
+def make_handler(server: PriceServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # keep-alive
+        disable_nagle_algorithm = True  # else small responses wait ~40ms for the delayed ACK
+
+        def log_message(self, format, *args):
+            pass
+
+        def send(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = [unquote(p) for p in url.path.strip('/').split('/')]
+            query = {key: value[0] for key, value in parse_qs(url.query).items()}
+            try:
+                match path:
+                    case ['v2', 'items']:
+                        return self.send(200, server.get_raw_catalog())
+                    case ['v1', 'items', url_name, ('orders' | 'statistics') as kind]:
+                        return self.send(200, server.get_raw_item(url_name, kind))
+                    case ['api', 'item']:
+                        func = lambda: server.item_info(query.get('name', ''))
+                    case ['api', 'price', url_name]:
+                        func = lambda: server.price(url_name, query.get('oracle'), get_int_param(query, 'mod_rank', 0))
+                    case ['api', 'relic']:
+                        func = lambda: server.relic_info(query.get('name', '').split(','), query.get('level', 'Radiant'))
+                    case ['api', 'syndicate']:
+                        func = lambda: server.syndicate(query.get('name', ''))
+                    case ['api', 'metrics']:
+                        return self.send(200, json.dumps(server.metrics()).encode())
+                    case _:
+                        return self.send(404, json.dumps({'error': 'not found'}).encode())
+                body = server.result_cache.get(
+                    (url.path, tuple(sorted(query.items()))), lambda: json.dumps(func()).encode()
+                )
+            except BadRequest as e:
+                return self.send(400, json.dumps({'error': str(e)}).encode())
+            except KeyError as e:
+                return self.send(404, json.dumps({'error': f'not found: {e}'}).encode())
+            except fetch.FetchError as e:
+                # pass 4xx from upstream on as is, anything else is upstream being broken
+                status = e.status_code if 400 <= e.status_code < 500 else 502
+                return self.send(status, json.dumps({'error': f'upstream: {e}'}).encode())
+            except Exception as e:
+                return self.send(500, json.dumps({'error': repr(e)}).encode())
+            self.send(200, body)
+
+    return Handler
+
+def serve(host: str = '127.0.0.1', port: int = 8642, upstream: str = 'https://api.warframe.market', **server_kwargs):
+    # WFM_API_BASE may be pointing at this server for the clients, don't fetch from ourselves
+    wfm.API_BASE = upstream
+    httpd = ThreadingHTTPServer((host, port), make_handler(PriceServer(**server_kwargs)))
+    httpd.daemon_threads = True
+    print(f'serving on http://{host}:{port}')
+    httpd.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='local price server sharing one cache')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--upstream', default='https://api.warframe.market')
+    parser.add_argument('--item-ttl', type=float, default=60, help='seconds an item\'s orders / statistics are cached')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.upstream, item_ttl=args.item_ttl)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+    binary market snapshot, so restarting doesn't mean refetching / reparsing everything
+
+    layout:
+        b'WFMSNAP1' | uint64 directory size | directory (json) | arrays, each 8 byte aligned
+
+    the directory maps array name -> [dtype, offset, count], every array is a fixed-width column:
+        - per item: strings (id, url_name, item_name, thumb, tags, set_parts) as blob + offsets,
+          max rank, set info, flags
+        - per statistic segment (e.g. closed_48hours): offsets per item, then one array per stat column
+        - orders: offsets per item, then one array per order column
+    loading only mmap-s the file and makes numpy views into it, nothing is parsed until
+    a Statistic / Orders of that item is actually accessed
+"""
+import datetime
+import json
+import mmap
+import struct
+
+import numpy as np
+
+import warframe_market as wfm
+
+MAGIC = b'WFMSNAP1'
+
+STAT_SEGMENTS = [
+    ('statistics_closed', '48hours'), ('statistics_closed', '90days'),
+    ('statistics_opened', '48hours'), ('statistics_opened', '90days'),
+]
+STAT_COLUMNS = {
+    'volume': '<i4', 'mod_rank': '<i2',
+    'min_price': '<f8', 'max_price': '<f8', 'open_price': '<f8', 'closed_price': '<f8',
+    'avg_price': '<f8', 'wa_price': '<f8', 'median': '<f8', 'moving_avg': '<f8',
+    'donch_top': '<f8', 'donch_bot': '<f8',
+}
+ORDER_COLUMNS = {
+    'is_sell': '<u1', 'visible': '<u1', 'platinum': '<i4', 'quantity': '<i4',
+    'user_reputation': '<i4', 'user_status': '<u1', 'mod_rank': '<i2',
+}
+ITEM_STRINGS = ['id', 'url_name', 'item_name', 'thumb']
+USER_STATUS = ['offline', 'online', 'ingame']
+
+def _segment_name(stat_type: str, timeframe_type: str):
+    return f"{stat_type.split('_')[1]}_{timeframe_type}"
+
+def _offsets(lengths: list[int]):
+    return np.concatenate([[0], np.cumsum(lengths, dtype=np.uint64)]).astype('<u4')
+
+def write_snapshot(path: str, market_items: list[wfm.MarketItem], created_at: datetime.datetime | None = None):
+    """
+        items that are not prepare()-ed are saved without orders and statistic
+        created_at: when the data is from, now if None
+    """
+    arrays: dict[str, np.ndarray] = {}
+
+    for key in ITEM_STRINGS:
+        encoded = [(getattr(item, key) or '').encode() for item in market_items]
+        arrays[f'item_{key}_offsets'] = _offsets([len(s) for s in encoded])
+        arrays[f'item_{key}_blob'] = np.array(bytearray(b''.join(encoded)), dtype='<u1')
+    for key in ['tags', 'set_parts']:
+        encoded = [','.join(getattr(item, key)).encode() for item in market_items]
+        arrays[f'item_{key}_offsets'] = _offsets([len(s) for s in encoded])
+        arrays[f'item_{key}_blob'] = np.array(bytearray(b''.join(encoded)), dtype='<u1')
+    arrays['item_set_root'] = np.array([item.is_set_root for item in market_items], dtype='<u1')
+    arrays['item_quantity_in_set'] = np.array([item.quantity_in_set for item in market_items], dtype='<i2')
+    arrays['item_max_rank'] = np.array([
+        item.mod_max_rank if item.is_mod_info_available and item.is_mod else -1
+        for item in market_items
+    ], dtype='<i2')
+    arrays['item_mod_info_available'] = np.array([item.is_mod_info_available for item in market_items], dtype='<u1')
+    arrays['item_prepared'] = np.array([item.statistic is not None for item in market_items], dtype='<u1')
+
+    for stat_type, timeframe_type in STAT_SEGMENTS:
+        segment = _segment_name(stat_type, timeframe_type)
+        stat_ls = [
+            item.statistic.statistics.get(stat_type, {}).get(timeframe_type, []) if item.statistic is not None else []
+            for item in market_items
+        ]
+        arrays[f'{segment}_offsets'] = _offsets([len(stats) for stats in stat_ls])
+        arrays[f'{segment}_datetime'] = np.array([
+            stat['datetime'].timestamp() for stats in stat_ls for stat in stats
+        ], dtype='<i8')
+        for column, dtype in STAT_COLUMNS.items():
+            missing = 0 if column in ['volume', 'mod_rank'] else np.nan
+            arrays[f'{segment}_{column}'] = np.array([
+                stat.get(column, missing) for stats in stat_ls for stat in stats
+            ], dtype=dtype)
+
+    order_ls = [item.orders.orders if item.orders is not None else [] for item in market_items]
+    arrays['orders_offsets'] = _offsets([len(orders) for orders in order_ls])
+    for column, dtype in ORDER_COLUMNS.items():
+        if column == 'user_status':
+            values = [USER_STATUS.index(order.user_status) for orders in order_ls for order in orders]
+        else:
+            values = [getattr(order, column) for orders in order_ls for order in orders]
+        arrays[f'orders_{column}'] = np.array(values, dtype=dtype)
+
+    # directory, offsets are relative to the start of the array section
+    created_at = created_at or datetime.datetime.now(datetime.timezone.utc)
+    directory = {'created_at': created_at.isoformat(),
+                 'n_items': len(market_items), 'arrays': {}}
+    offset = 0
+    for name, array in arrays.items():
+        directory['arrays'][name] = [array.dtype.str, offset, len(array)]
+        offset += (array.nbytes + 7) // 8 * 8
+
+    directory_bytes = json.dumps(directory).encode()
+    directory_bytes += b' ' * (-(len(MAGIC) + 8 + len(directory_bytes)) % 8)
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(directory_bytes)) + directory_bytes)
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b'\0' * (-array.nbytes % 8))
+
+class SnapshotStatistic(wfm.Statistic):
+    """
+        Statistic that reads one item from a snapshot, the dicts are only
+        made the first time .statistics is accessed
+    """
+    def __init__(self, snapshot: 'Snapshot', index: int, basis_time: datetime.datetime | None = None):
+        self._snapshot = snapshot
+        self._index = index
+        self._statistics = None
+        self.basis_time = basis_time
+
+    @property
+    def statistics(self):
+        if self._statistics is None:
+            self._statistics = {}
+            for stat_type, timeframe_type in STAT_SEGMENTS:
+                self._statistics.setdefault(stat_type, {})[timeframe_type] = \
+                    self._snapshot._get_stats(_segment_name(stat_type, timeframe_type), self._index)
+        return self._statistics
+
+class SnapshotOrders(wfm.Orders):
+    """
+        Orders that reads one item from a snapshot, the Order list is only
+        made the first time .orders is accessed
+    """
+    def __init__(self, snapshot: 'Snapshot', index: int):
+        self._snapshot = snapshot
+        self._index = index
+        self._orders = None
+
+    @property
+    def orders(self):
+        if self._orders is None:
+            self._orders = self._snapshot._get_orders(self._index)
+        return self._orders
+
+class Snapshot:
+    """
+        read only view of a snapshot file
+        use get_market_items() / get_market_item() to get MarketItem back
+    """
+    def __init__(self, path: str, basis_time: datetime.datetime | None = None):
+        """
+            basis_time: given to every Statistic, None to calculate the "last N hours" from now
+                        like a freshly fetched Statistic does. snapshot.created_at may be what you want.
+        """
+        self.basis_time = basis_time
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a market snapshot')
+        directory_size, = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        base = len(MAGIC) + 8
+        directory = json.loads(self._mmap[base:base + directory_size])
+        base += directory_size
+
+        self.created_at = datetime.datetime.fromisoformat(directory['created_at'])
+        self.n_items = directory['n_items']
+        self._arrays = {
+            name: np.frombuffer(self._mmap, dtype=dtype, count=count, offset=base + offset)
+            for name, (dtype, offset, count) in directory['arrays'].items()
+        }
+        self._id_index = None
+
+    def _get_string(self, key: str, index: int):
+        offsets = self._arrays[f'item_{key}_offsets']
+        return bytes(self._arrays[f'item_{key}_blob'][offsets[index]:offsets[index + 1]]).decode()
+
+    def _get_stats(self, segment: str, index: int):
+        offsets = self._arrays[f'{segment}_offsets']
+        rows = slice(offsets[index], offsets[index + 1])
+        columns = {column: self._arrays[f'{segment}_{column}'][rows].tolist() for column in STAT_COLUMNS}
+        stats = []
+        for i, timestamp in enumerate(self._arrays[f'{segment}_datetime'][rows].tolist()):
+            stat = {'datetime': datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)}
+            for column, values in columns.items():
+                if values[i] == values[i]:  # skip NaN, i.e. the column doesn't exist in this stat
+                    stat[column] = values[i]
+            stats.append(stat)
+        return stats
+
+    def _get_orders(self, index: int):
+        offsets = self._arrays['orders_offsets']
+        rows = slice(offsets[index], offsets[index + 1])
+        columns = {column: self._arrays[f'orders_{column}'][rows].tolist() for column in ORDER_COLUMNS}
+        return [
+            wfm.Orders.Order(
+                order_type='sell' if columns['is_sell'][i] else 'buy',
+                visible=bool(columns['visible'][i]),
+                platinum=columns['platinum'][i],
+                quantity=columns['quantity'][i],
+                user_reputation=columns['user_reputation'][i],
+                user_status=USER_STATUS[columns['user_status'][i]],
+                mod_rank=columns['mod_rank'][i],
+            )
+            for i in range(len(columns['is_sell']))
+        ]
+
+    def get_market_item(self, index: int) -> wfm.MarketItem:
+        max_rank = int(self._arrays['item_max_rank'][index])
+        market_json = {
+            'id': self._get_string('id', index),
+            'urlName': self._get_string('url_name', index),
+            'i18n': {'en': {'name': self._get_string('item_name', index),
+                            'thumb': self._get_string('thumb', index) or None}},
+        }
+        if max_rank >= 0:
+            market_json['maxRank'] = max_rank
+        if 'item_tags_offsets' in self._arrays:    # older snapshots don't have these
+            market_json['tags'] = [tag for tag in self._get_string('tags', index).split(',') if tag]
+            market_json['setParts'] = [part for part in self._get_string('set_parts', index).split(',') if part]
+            market_json['setRoot'] = bool(self._arrays['item_set_root'][index])
+            market_json['quantityInSet'] = int(self._arrays['item_quantity_in_set'][index])
+        item = wfm.MarketItem(market_json, api_version='v2')
+        item.is_mod_info_available = bool(self._arrays['item_mod_info_available'][index])
+
+        if self._arrays['item_prepared'][index]:
+            item.statistic = SnapshotStatistic(self, index, self.basis_time)
+            item.orders = SnapshotOrders(self, index)
+            item.price = wfm.PriceOracle(item, item.orders, item.statistic)
+        return item
+
+    def get_market_item_by_id(self, item_id: str) -> wfm.MarketItem:
+        if self._id_index is None:
+            self._id_index = {self._get_string('id', i): i for i in range(self.n_items)}
+        return self.get_market_item(self._id_index[item_id])
+
+    def get_market_items(self) -> list[wfm.MarketItem]:
+        return [self.get_market_item(i) for i in range(self.n_items)]
+
+def load_snapshot(path: str, basis_time: datetime.datetime | None = None) -> Snapshot:
+    return Snapshot(path, basis_time)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='fetch the whole market into a snapshot file')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    market_items = wfm.get_market_item_list()
+    wfm.prepare_market_items(market_items, priority='background', job='snapshot')
+    write_snapshot(args.path, market_items)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,4 @@
 import contextlib
-import joblib
-from tqdm import tqdm
 
 @contextlib.contextmanager
 def tqdm_joblib(tqdm_object):
@@ -17,6 +15,8 @@ def tqdm_joblib(tqdm_object):
             Parallel(n_jobs=16)(delayed(sqrt)(i**2) for i in range(10))
         ```
     """
+    import joblib
+
     class TqdmBatchCompletionCallback(joblib.parallel.BatchCompletionCallBack):
         def __call__(self, *args, **kwargs):
             tqdm_object.update(n=self.batch_size)
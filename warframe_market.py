@@ -1,36 +1,26 @@
+# heavy modules (requests via fetch.py, joblib, tqdm, numpy via oracle.py) are imported inside
+# the functions that need them, so importing this just for Statistic / PriceOracle stays cheap.
+# see check_import_time.py
 from dataclasses import dataclass
 import json
-import re
-
-import requests
-from joblib import Parallel, delayed
-import time
-import random
 import datetime
-import math
+import os
 import itertools
-import statistics
-
-import util
-from tqdm import tqdm
 
+# can be pointed at a stand-in server for testing, e.g. WFM_API_BASE=http://127.0.0.1:8000
+API_BASE = os.environ.get('WFM_API_BASE', 'https://api.warframe.market')
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"
 
-def retry_request(*args, **kwargs):
-    """
-        automatically retry request until the request is done.
-        this is to retry whenever too many requests happens
+def retry_request(*args, priority: str = 'interactive', job: str = 'default', **kwargs):
     """
-    while True:
-        r = requests.get(*args, **kwargs)
+        automatically retry request whenever too many requests (or a 5xx) happens,
+        raises fetch.FetchError on other statuses or after too many retries
 
-        if r.status_code == 200:
-            break
-
-        # wait a random time because there may be multiple requests
-        # at the exact same time as this
-        time.sleep(random.uniform(0, 1))    
-    return r
+        goes through the global fetch scheduler (see fetch.py), so every request
+        shares one rate limit, and 'interactive' ones go before 'watch' / 'background' ones
+    """
+    import fetch
+    return fetch.get_scheduler().request(*args, priority=priority, job=job, **kwargs)
 
 class Orders:
     """
@@ -46,6 +36,7 @@ class Orders:
         user_reputation: int
         user_status: str
         mod_rank: int
+        subtype: str | None = None   # e.g. 'intact' / 'radiant' for relics, None if the item has none
 
         @property
         def is_sell(self):
@@ -73,7 +64,8 @@ class Orders:
                 'quantity': order['quantity'],
                 'user_reputation': order['user']['reputation'],
                 'user_status': order['user']['status'], # can be ['offline', 'online', 'ingame']
-                'mod_rank': order.get('mod_rank', 0)
+                'mod_rank': order.get('mod_rank', 0),
+                'subtype': order.get('subtype'),
             })
             self.orders.append(cur_order)
             
@@ -130,6 +122,7 @@ class Statistic:
                     "donch_bot": 10,
                     "id": "66a74c44bba77400155161b8",
                     "mod_rank": a number
+                    "subtype": "intact"  # may appear, e.g. relic refinement
                 },
                 note that the json MIGHT sort timeslot in ascending order so...take note of that
                 the 90days timeslot will only record up until the last time 00:00 UTC happens
@@ -146,6 +139,7 @@ class Statistic:
                 for stat in self.statistics[stat_type][timeframe_type]:
                     stat['datetime'] = datetime.datetime.fromisoformat(stat['datetime'])
                     stat['mod_rank'] = stat.get('mod_rank', 0)
+                    stat['subtype'] = stat.get('subtype')
 
     """
         Statistic filtering, should be given **stat_filter:
@@ -161,11 +155,13 @@ class Statistic:
                               future proof and the fact that i don't know what an item's max rank is,
                               you can set this as [0] or range(1, 100) to filter these 2 cases for now 
                               (or range(100) if you specifically want all the mod ranks)
+            - subtype: e.g. 'intact' to only count intact relics. None (default) for every subtype,
+                       timeslots without a subtype always count
     """
 
     def get_stat_for_last_hours(self, hours: int, 
                                 basis_time: datetime.datetime | None = None,
-                                mod_rank_range: list | range = [0]):
+                                mod_rank_range: list | range = [0], subtype: str | None = None):
         """
             get the closed trade stat for the last {hours} hours
             hours in range [1, 48], might not be up to 48 because it depends on
@@ -185,13 +181,14 @@ class Statistic:
             stat for stat in self.statistics['statistics_closed']['48hours']
             if stat['datetime'] > basis_time - datetime.timedelta(hours=hours)
             and stat['mod_rank'] in mod_rank_range
+            and (subtype is None or stat['subtype'] in [None, subtype])
         ]
 
         return valid_stat
 
     def get_stat_for_last_days(self, days: int, 
                                basis_time: datetime.datetime | None = None,
-                               mod_rank_range: list | range = [0]):
+                               mod_rank_range: list | range = [0], subtype: str | None = None):
         """
             get the closed trade stat for the last {days} days
             days in range [1, 90], might not be up to 90 because it depends on
@@ -212,6 +209,7 @@ class Statistic:
             stat for stat in self.statistics['statistics_closed']['90days']
             if stat['datetime'] > basis_time - datetime.timedelta(days=days)
             and stat['mod_rank'] in mod_rank_range
+            and (subtype is None or stat['subtype'] in [None, subtype])
         ]
 
         return valid_stats
@@ -285,6 +283,7 @@ class PriceOracle:
         if len(stats) == 0:
             return 0
         
+        import statistics
         prices = [[stat['median']] * stat['volume'] for stat in stats]
         prices = list(itertools.chain.from_iterable(prices))
         prices = sorted(prices, reverse=True)
@@ -303,6 +302,7 @@ class PriceOracle:
         if len(stats) == 0:
             return 0
         
+        import statistics
         prices = [[stat['median']] * stat['volume'] for stat in stats]
         prices = list(itertools.chain.from_iterable(prices))
         prices = sorted(prices, reverse=True)
@@ -312,20 +312,34 @@ class PriceOracle:
             return statistics.mean(prices)
         return statistics.mean(top_K)
 
+    def get_oracle_price(self, oracle_name: str | None = None, **stat_filter):
+        """
+            use a strategy in oracle.oracle_registry
+            oracle_name: None to use the strategy of this item's category (see oracle.category_oracle_map),
+                'default' if there is no item
+            orders are only needed if the strategy uses them, so PriceOracle(None, None, statistic) works for the rest
+        """
+        import oracle
+        if oracle_name is not None:
+            strategy = oracle.oracle_registry[oracle_name]
+        else:
+            strategy = oracle.get_category_oracle(
+                oracle.get_item_category(self.item.item_name) if self.item is not None else 'default'
+            )
+        if strategy.need_orders and self.orders is None:
+            raise ValueError(f'oracle {strategy.name!r} needs orders, this PriceOracle has none')
+        orders_ls = [self.orders] if strategy.need_orders else None
+        return float(strategy.evaluate(oracle.MarketMatrix.from_data([self.statistic], orders_ls, **stat_filter))[0])
+
     def get_oracle_price_48hrs(self, **stat_filter):
         """
             For the best price that probably applies to everything
             must be prepare()-ed first
-        """
-        # return self.get_avg_median_price_for_last_hours(48, 0.5, **stat_filter)
-        return self.get_top_k_avg_price_for_last_hours(48, 0.3, **stat_filter)
-        # price = self.get_top_k_avg_price_for_last_hours(3, 1, **stat_filter)
-        # if price > 0: return price
-
-        # price = self.get_top_k_avg_price_for_last_hours(48, 0.3, **stat_filter)
-        # if price > 0: return price
 
-        # return self.orders.get_ingame_topK_buy_price(5, mod_rank_range=stat_filter.get('mod_rank_range', [0]))
+            the actual rule is chosen by the item's category, change it in
+            data/oracle_data.py or with the Oracle function in the CLI
+        """
+        return self.get_oracle_price(**stat_filter)
 
 class MarketItem:
     def __init__(self, market_json: dict, api_version: str = 'v1'):
@@ -342,10 +356,15 @@ class MarketItem:
                     tags: []
                     urlName: "healing_flame"
                     maxRank: 3  # may appear
+                    # the per item json (/v2/item/<slug>) has these, the /v2/items list may not
+                    setRoot: true  # for the set itself
+                    setParts: ["...", ...]  # ids of everything in the set (including the set)
+                    quantityInSet: 2  # how many of this part a set needs
                 }
 
             accessible traits:
                 - id, url_name, thumb, item_name: accessible
+                - tags, is_set_root, set_parts, quantity_in_set: accessible, empty / False / [] / 1 for v1
                 - orders, statistics: need to prepare() first, else None
                 - is_mod_info_available: accessible, and if True:
                     - is_mod: accessible
@@ -356,6 +375,10 @@ class MarketItem:
             self.url_name = market_json['url_name']
             self.thumb = market_json['thumb']
             self.item_name = market_json['item_name']
+            self.tags: list[str] = []
+            self.is_set_root = False
+            self.set_parts: list[str] = []
+            self.quantity_in_set = 1
             self.orders: Orders | None = None
             self.statistic: Statistic | None = None
             self.price: PriceOracle | None = None
@@ -366,6 +389,10 @@ class MarketItem:
             self.url_name = market_json['urlName']
             self.thumb = market_json['i18n']['en'].get('thumb', None)
             self.item_name = market_json['i18n']['en']['name']
+            self.tags = market_json.get('tags', [])
+            self.is_set_root = market_json.get('setRoot', False)
+            self.set_parts = market_json.get('setParts', [])
+            self.quantity_in_set = market_json.get('quantityInSet', 1)
             self.orders = None
             self.statistic = None
             self.price = None
@@ -373,31 +400,36 @@ class MarketItem:
             self.is_mod = ('maxRank' in market_json)
             self.mod_max_rank = market_json.get('maxRank', 0)
 
-    def _get_orders(self):
-        r = retry_request(f'https://api.warframe.market/v1/items/{self.url_name}/orders', headers={
+    def _get_orders(self, **fetch_kwargs):
+        r = retry_request(f'{API_BASE}/v1/items/{self.url_name}/orders', headers={
             'accept': 'application/json',
             'Platform': 'pc',
             'User-agent': USER_AGENT
-        })
+        }, **fetch_kwargs)
 
         return Orders(json.loads(r.content)['payload']['orders'])
 
-    def _get_statistic(self):
-        r = retry_request(f'https://api.warframe.market/v1/items/{self.url_name}/statistics', headers={
+    def _get_statistic_json(self, **fetch_kwargs):
+        r = retry_request(f'{API_BASE}/v1/items/{self.url_name}/statistics', headers={
             'accept': 'application/json',
             'Platform': 'pc',
             'User-agent': USER_AGENT
-        })
+        }, **fetch_kwargs)
+
+        return json.loads(r.content)['payload']
 
-        return Statistic(json.loads(r.content)['payload'])
+    def _get_statistic(self, **fetch_kwargs):
+        return Statistic(self._get_statistic_json(**fetch_kwargs))
     
-    def prepare(self):
+    def prepare(self, priority: str = 'interactive', job: str = 'default'):
         """
             fetch anything it can first and store inside itself
             please don't get_order or get_statistics yourself
+
+            priority, job: for the fetch scheduler, see fetch.py
         """
-        self.orders = self._get_orders()
-        self.statistic = self._get_statistic()
+        self.orders = self._get_orders(priority=priority, job=job)
+        self.statistic = self._get_statistic(priority=priority, job=job)
         self.price = PriceOracle(self, self.orders, self.statistic)
 
         return self.orders, self.statistic, self.price
@@ -414,7 +446,7 @@ class MarketItem:
         return f'<MarketItem "{self.item_name}">'
 
 def get_market_item_list() -> list[MarketItem]:
-    r = retry_request('https://api.warframe.market/v2/items', headers={
+    r = retry_request(f'{API_BASE}/v2/items', headers={
         'accept': 'application/json',
         'Language': 'en',
         'User-agent': USER_AGENT
@@ -423,10 +455,25 @@ def get_market_item_list() -> list[MarketItem]:
     items = json.loads(r.content)['data']
     return [MarketItem(i, api_version='v2') for i in items]
 
-def prepare_market_items(market_items: list[MarketItem]):
-    "does parallel"
+def prepare_market_items(market_items: list[MarketItem], priority: str = 'interactive', job: str = 'default',
+                         failed: list[tuple[MarketItem, Exception]] | None = None):
+    """
+        does parallel
+        failed: if given, items that can't be fetched (fetch.FetchError) are left unprepared and
+            put in it as (item, error), instead of the error being raised
+    """
+    from joblib import Parallel, delayed
+    from tqdm import tqdm
+    import fetch
+    import util
+
     def task(item: MarketItem):
-        item.prepare()
+        try:
+            item.prepare(priority, job)
+        except fetch.FetchError as e:
+            if failed is None:
+                raise
+            failed.append((item, e))
         return item
     
     with util.tqdm_joblib(tqdm(range(len(market_items)), 'Fetching items...')) as tqdm_progress:
@@ -454,6 +501,7 @@ def get_syndicate_items(syndicate_name: str, market_map: None | list[MarketItem]
     if syndicate_name in additional_syndicates:
         syndicate_item_names = additional_syndicates[syndicate_name]['names']
     else:
+        import requests
         r = requests.get('https://drops.warframestat.us/data/syndicates.json')
         syndicate_item_names = json.loads(r.content)['syndicates'][syndicate_name]
         syndicate_item_names = [i['item'] for i in syndicate_item_names]
@@ -482,26 +530,10 @@ def get_relic_data(discard_forma: bool = False) -> dict[str, dict[str, list[str]
         discard_forma: doesn't contain forma information if true
 
         return {relic name -> {rarity: list of items}}
+        see relic.get_relic_table() for the exact drop chances, this is cached too
     """
-    r = retry_request('https://drops.warframestat.us/data/relics.json')
-    relic_data_ls = json.loads(r.content)['relics']
-    relic_map = {}
-    for relic_data in relic_data_ls:
-        if relic_data['state'] != 'Intact':
-            continue    # we only want the list of items
-
-        relic = {"Common": [], "Uncommon": [], "Rare": []}
-        for reward in relic_data['rewards']:
-            if discard_forma and 'Forma Blueprint' in reward['itemName']:
-                continue
-            
-            # filter by chance: [25.33, 11, 2], use 20, 5 as a bound
-            if reward['chance'] > 20:
-                relic['Common'].append(reward['itemName'])
-            elif reward['chance'] > 5:
-                relic['Uncommon'].append(reward['itemName'])
-            else:
-                relic['Rare'].append(reward['itemName'])
-        relic_map[f"{relic_data['tier']} {relic_data['relicName']}"] = relic
-
-    return relic_map
\ No newline at end of file
+    import relic
+    table = relic.get_relic_table()
+    if discard_forma:
+        table = table.discard_items('Forma Blueprint')
+    return table.to_relic_data_map()